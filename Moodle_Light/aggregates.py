@@ -0,0 +1,83 @@
+import threading
+from itertools import islice
+
+class SubmissionStats:
+    """Per-course and per-student submission aggregates for the profile page.
+
+    Built once from the submissions collection, then kept current from the
+    storage's change events; a write made by another process changes the
+    collection version without an event here and triggers a rebuild."""
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._seen = None    # collection version the aggregates reflect
+        self._courses = {}   # course_id -> {"subs_count": n, "pending": {(tid, uid): sub}}
+        self._students = {}  # user_id -> {"subs": {tid: sub}, "graded_sum": n, "graded_count": n}
+        db.subscribe("submissions", self._on_change)
+
+    def _course_id(self, tid):
+        task = self.db.get("tasks", tid)
+        return task["course_id"] if task else None
+
+    def _add(self, sub, sign):
+        key = (sub["task_id"], sub["user_id"])
+        cid = self._course_id(sub["task_id"])
+        if cid is not None:
+            course = self._courses.setdefault(cid, {"subs_count": 0, "pending": {}})
+            course["subs_count"] += sign
+            if sub.get("grade") is None:
+                if sign > 0:
+                    course["pending"][key] = sub
+                else:
+                    course["pending"].pop(key, None)
+        student = self._students.setdefault(sub["user_id"], {"subs": {}, "graded_sum": 0, "graded_count": 0})
+        if sign > 0:
+            student["subs"][sub["task_id"]] = sub
+        else:
+            student["subs"].pop(sub["task_id"], None)
+        if isinstance(sub.get("grade"), int):
+            student["graded_sum"] += sign * sub["grade"]
+            student["graded_count"] += sign
+
+    def _on_change(self, changes, before, after):
+        with self._lock:
+            if self._seen != before:
+                self._seen = None
+                return
+            for old, new in changes:
+                if old is not None:
+                    self._add(old, -1)
+                if new is not None:
+                    self._add(new, +1)
+            self._seen = after
+
+    def _sync(self):
+        # rows first, version second: the rows are never newer than the
+        # version recorded, so a concurrent write only causes another rebuild
+        if self._seen is not None and self._seen == self.db.version("submissions"):
+            return
+        self._courses, self._students = {}, {}
+        for sub in self.db.all("submissions"):
+            self._add(sub, +1)
+        self._seen = self.db.version("submissions")
+
+    def course(self, cid, pending_limit=10):
+        with self._lock:
+            self._sync()
+            course = self._courses.get(cid) or {"subs_count": 0, "pending": {}}
+            return {
+                "subs_count": course["subs_count"],
+                "pending_count": len(course["pending"]),
+                "pending": list(islice(course["pending"].values(), pending_limit)),
+            }
+
+    def student(self, uid):
+        with self._lock:
+            self._sync()
+            student = self._students.get(uid) or {"subs": {}, "graded_sum": 0, "graded_count": 0}
+            count = student["graded_count"]
+            return {
+                "subs": list(student["subs"].values()),
+                "avg_grade": round(student["graded_sum"] / count, 2) if count else None,
+            }
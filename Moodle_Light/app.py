@@ -1,44 +1,82 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, abort, flash
-import os
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, abort, flash, send_file, g, \
+    Response, stream_with_context
+import base64, csv, hashlib, io, json, os
 from functools import wraps
-from service import load_json, save_json
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
+from service import load_json, open_storage, migrate_json_to_sqlite
+import metrics, uploads
+from sessions import FileSessionStore, MemorySessionStore, ServerSessionInterface, SessionUsers
+from aggregates import SubmissionStats
+from search import SearchIndex
+from pagecache import PageCache
 from datetime import datetime, timezone
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
+app.request_class = uploads.UploadRequest
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret")  # замените в проде
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# каталог с данными (*.json, uploads/, moodle.db); по умолчанию рядом с app.py
+DATA_DIR = os.getenv("MOODLE_DATA_DIR", BASE_DIR)
 
-TASKS = os.path.join(BASE_DIR, "tasks.json")
-UPLOADS = os.path.join(BASE_DIR, "uploads")
+UPLOADS = os.path.join(DATA_DIR, "uploads")
 os.makedirs(UPLOADS, exist_ok=True)
-
-USERS       = os.path.join(BASE_DIR, "users.json")
-COURSES     = os.path.join(BASE_DIR, "courses.json")
-COMMENTS    = os.path.join(BASE_DIR, "comments.json")
-SUBMISSIONS = os.path.join(BASE_DIR, "submissions.json")
+app.config["UPLOADS"] = UPLOADS
+# максимальный размер одного файла ответа; запрос целиком может быть чуть больше (поля формы)
+app.config["MAX_UPLOAD_SIZE"] = int(os.getenv("MOODLE_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+app.config["MAX_CONTENT_LENGTH"] = app.config["MAX_UPLOAD_SIZE"] + 1024 * 1024
+# за nginx/Apache: отдавать файлы через X-Sendfile вместо Python
+app.config["USE_X_SENDFILE"] = os.getenv("MOODLE_X_SENDFILE") == "1"
+# время хранилища/шаблонов по запросам — в /metrics; с MOODLE_SERVER_TIMING=1
+# ещё и в заголовке Server-Timing каждого ответа (видно в DevTools)
+metrics.init_app(app, server_timing_header=os.getenv("MOODLE_SERVER_TIMING") == "1")
+
+# хранилище: json (файлы *.json рядом с app.py) или sqlite
+STORAGE = os.getenv("MOODLE_STORAGE", "json")
+DB_PATH = os.getenv("MOODLE_DB", os.path.join(DATA_DIR, "moodle.db"))
+db = open_storage(STORAGE, DATA_DIR, DB_PATH)
+
+# сессии на сервере, в cookie только случайный id: file (общие для воркеров,
+# переживают перезапуск), memory (один процесс) или cookie (подписанная cookie Flask)
+SESSIONS = os.getenv("MOODLE_SESSIONS", "file")
+if SESSIONS == "file":
+    app.session_interface = ServerSessionInterface(FileSessionStore(os.path.join(DATA_DIR, "sessions")))
+elif SESSIONS == "memory":
+    app.session_interface = ServerSessionInterface(MemorySessionStore())
+# пользователь сессии читается из хранилища один раз и сбрасывается при его изменении
+session_users = SessionUsers(db)
+# счётчики для профиля, обновляются при каждой записи в submissions
+stats = SubmissionStats(db)
+# полнотекстовый поиск по курсам, заданиям и комментариям
+search_index = SearchIndex(db, os.path.join(DATA_DIR, "search_index.json"))
+# готовые страницы для самых читаемых маршрутов; 0 — выключить
+pages = PageCache(db, int(os.getenv("MOODLE_PAGE_CACHE", "256")))
 
 # ----------------- auth helpers -----------------
-def _load_users():
-    return load_json(USERS, {"users": []})
-
 def get_user_by_id(uid: int):
-    data = _load_users()
-    for u in data["users"]:
-        if u["id"] == uid:
-            return u
-    return None
+    return db.get("users", uid)
 
 def get_user_by_username(username: str):
-    data = _load_users()
-    for u in data["users"]:
-        if u["username"] == username:
-            return u
-    return None
+    users = db.find("users", "username", username)
+    return users[0] if users else None
+
+def usernames_for(ids):
+    """{uid: username} для списка id; каждый пользователь читается один раз за запрос."""
+    ids = list(ids)
+    cache = g.setdefault("usernames", {})
+    missing = {uid for uid in ids if uid not in cache}
+    if missing:
+        users = db.get_many("users", missing)
+        for uid in missing:
+            cache[uid] = users[uid]["username"] if uid in users else f"user#{uid}"
+    return {uid: cache[uid] for uid in ids}
+
+def username(uid):
+    return usernames_for([uid])[uid]
 
 def current_user():
-    uid = session.get("uid")
-    return get_user_by_id(uid) if uid else None
+    return session_users.get(session)
 
 def login_required(fn):
     @wraps(fn)
@@ -61,39 +99,51 @@ def teacher_required(fn):
         return fn(*a, **kw)
     return wrapper
 
-# ----------------- courses helpers -----------------
-def _load_courses():
-    return load_json(COURSES, {"courses": []})
+def cached_page(*collections):
+    """Отдаёт страницу из кэша, пока не изменилась ни одна из коллекций.
+
+    Ключ — маршрут, его аргументы и uid: в шапке страницы имя пользователя,
+    а кнопки зависят от роли. Пользователь сам входит в зависимости (users)."""
+    collections = collections + ("users",)
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*a, **kw):
+            if request.query_string:
+                return fn(*a, **kw)
+            key = (request.endpoint, tuple(sorted(kw.items())), session.get("uid"))
+            return pages.get_or_render(key, collections, lambda: fn(*a, **kw))
+        return wrapper
+    return decorator
 
-def _save_courses(data):
-    save_json(COURSES, data)
+# ----------------- courses helpers -----------------
+def _find_course(cid):
+    return db.get("courses", cid)
 
-def _find_course(cid, data=None):
-    data = data or _load_courses()
-    for c in data["courses"]:
-        if c["id"] == cid:
-            return c
-    return None
+def _course_comments(cid):
+    return db.find("comments", "course_id", cid)
 
 # ----------------- task helpers -----------------
-def _load_tasks():
-    return load_json(TASKS, {"tasks": []})
+def _find_task(tid):
+    return db.get("tasks", tid)
 
-def _save_tasks(data):
-    save_json(TASKS, data)
+def _course_tasks(cid):
+    return db.find("tasks", "course_id", cid)
 
-def _find_task(tid, data=None):
-    data = data or _load_tasks()
-    for t in data["tasks"]:
-        if t["id"] == tid:
-            return t
-    return None
+# ----------------- submissions helpers -----------------
+def _find_submission(tid, uid):
+    return db.get("submissions", (tid, uid))
+
+def _task_submissions(tid):
+    return db.find("submissions", "task_id", tid)
+
+def _user_submissions(uid):
+    return db.find("submissions", "user_id", uid)
 
 # ----------------- routes -----------------
 @app.route("/")
+@cached_page("courses")
 def index():
-    data = _load_courses()
-    return render_template("index.html", courses=data["courses"], user=current_user())
+    return render_template("index.html", courses=db.all("courses"), user=current_user())
 
 # API
 @app.post("/api/courses")
@@ -103,17 +153,123 @@ def api_add_course():
     title = (payload.get("title") or "").strip()
     if not title:
         return jsonify({"error": "title required"}), 400
-    data = _load_courses()
-    next_id = max((c["id"] for c in data["courses"]), default=0) + 1
-    course = {"id": next_id, "title": title, "description": ""}
-    data["courses"].append(course)
-    _save_courses(data)
+    course = db.insert("courses", {"title": title, "description": ""})
     return jsonify(course), 201
 
+# Списки API отдаются страницами: ?limit=N (по умолчанию 100, максимум 500),
+# следующая страница — по курсору из заголовков X-Next-Cursor / Link (?cursor=...).
+# ?fields=id,title оставляет только нужные поля. ETag зависит от версий коллекций,
+# так что повторный запрос с If-None-Match получает 304, пока данные не менялись.
+API_DEFAULT_LIMIT = 100
+API_MAX_LIMIT = 500
+
+def _encode_cursor(key):
+    raw = json.dumps(key)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        abort(400, description="bad cursor")
+    # все ключи страниц — целые id; иное сравнение с ними упало бы в 500
+    if not isinstance(key, int) or isinstance(key, bool):
+        abort(400, description="bad cursor")
+    return key
+
+def _int_list(arg):
+    try:
+        return {int(v) for v in arg.split(",") if v.strip()}
+    except ValueError:
+        abort(400, description="ids must be integers")
+
+def _api_etag(*collections, per_user=False):
+    versions = "|".join(str(db.version(name)) for name in collections)
+    who = session.get("uid") if per_user else ""
+    return hashlib.sha1(f"{versions}|{who}|{request.full_path}".encode()).hexdigest()
+
+def _api_page(rows, key, etag):
+    """Отсортировать rows по key, выдать страницу после курсора и нужные поля."""
+    try:
+        limit = min(max(int(request.args.get("limit", API_DEFAULT_LIMIT)), 1), API_MAX_LIMIT)
+    except ValueError:
+        abort(400, description="limit must be an integer")
+    rows = sorted(rows, key=key)
+    cursor = request.args.get("cursor")
+    if cursor:
+        after = _decode_cursor(cursor)
+        rows = [r for r in rows if key(r) > after]
+    page = rows[:limit]
+    fields = [f for f in (request.args.get("fields") or "").split(",") if f]
+    if fields:
+        page = [{f: r[f] for f in fields if f in r} for r in page]
+    resp = jsonify(page)
+    resp.set_etag(etag, weak=True)
+    if len(rows) > limit:
+        next_cursor = _encode_cursor(key(rows[limit - 1]))
+        args = {**request.args.to_dict(), "cursor": next_cursor}
+        resp.headers["X-Next-Cursor"] = next_cursor
+        resp.headers["Link"] = f'<{url_for(request.endpoint, **request.view_args, **args)}>; rel="next"'
+    return resp
+
+def _not_modified(etag):
+    if request.if_none_match.contains_weak(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag, weak=True)
+        return resp
+    return None
+
 @app.get("/api/courses")
 def api_get_courses():
-    data = _load_courses()
-    return jsonify(data["courses"])
+    etag = _api_etag("courses")
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    rows = db.all("courses")
+    if request.args.get("id"):
+        ids = _int_list(request.args["id"])
+        rows = [c for c in rows if c["id"] in ids]
+    return _api_page(rows, lambda c: c["id"], etag)
+
+@app.get("/api/courses/<int:cid>/tasks")
+@login_required
+def api_course_tasks(cid):
+    if not _find_course(cid):
+        abort(404)
+    etag = _api_etag("tasks")
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    rows = _course_tasks(cid)
+    if request.args.get("id"):
+        ids = _int_list(request.args["id"])
+        rows = [t for t in rows if t["id"] in ids]
+    return _api_page(rows, lambda t: t["id"], etag)
+
+@app.get("/api/tasks/<int:tid>/submissions")
+@login_required
+def api_task_submissions(tid):
+    if not _find_task(tid):
+        abort(404)
+    etag = _api_etag("submissions", per_user=True)
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    user = current_user()
+    if user["role"] == "teacher":
+        rows = _task_submissions(tid)
+    else:
+        # студент видит только свой ответ
+        own = _find_submission(tid, user["id"])
+        rows = [own] if own else []
+    if request.args.get("user_id"):
+        ids = _int_list(request.args["user_id"])
+        rows = [s for s in rows if s["user_id"] in ids]
+    graded = request.args.get("graded")
+    if graded in ("true", "false"):
+        want = graded == "true"
+        rows = [s for s in rows if (s.get("grade") is not None) == want]
+    return _api_page(rows, lambda s: s["user_id"], etag)
 
 @app.post("/add_course")
 @teacher_required
@@ -121,21 +277,17 @@ def add_course_form():
     title = (request.form.get("title") or "").strip()
     if not title:
         return redirect(url_for("index"))
-    data = _load_courses()
-    next_id = max((c["id"] for c in data["courses"]), default=0) + 1
-    data["courses"].append({"id": next_id, "title": title, "description": ""})
-    _save_courses(data)
+    db.insert("courses", {"title": title, "description": ""})
     return redirect(url_for("index"))
 
 @app.get("/course/<int:cid>")
+@cached_page("courses", "tasks", "comments")
 def course_view(cid):
-    data = _load_courses()
-    course = _find_course(cid, data)
+    course = _find_course(cid)
     if not course:
         abort(404)
-    comments_data = load_json(COMMENTS, {"comments": []})
-    comments = [cm for cm in comments_data["comments"] if cm["course_id"] == cid]
-    return render_template("course.html", course=course, comments=comments, user=current_user())
+    return render_template("course.html", course=course, tasks=_course_tasks(cid),
+                           comments=_course_comments(cid), user=current_user())
 
 @app.post("/course/<int:cid>/comment")
 @login_required
@@ -145,32 +297,25 @@ def course_comment_create(cid):
         return redirect(url_for("course_view", cid=cid))
     if not _find_course(cid):
         abort(404)
-    data = load_json(COMMENTS, {"comments": []})
-    next_id = max((cm["id"] for cm in data["comments"]), default=0) + 1
-    data["comments"].append({
-        "id": next_id,
+    db.insert("comments", {
         "course_id": cid,
         "user_id": current_user()["id"],
         "text": text
     })
-    save_json(COMMENTS, data)
     return redirect(url_for("course_view", cid=cid))
 
 @app.post("/course/<int:cid>/comment/<int:cmid>/delete")
 @teacher_required
 def course_comment_delete(cid, cmid):
-    data = load_json(COMMENTS, {"comments": []})
-    before = len(data["comments"])
-    data["comments"] = [cm for cm in data["comments"] if not (cm["id"] == cmid and cm["course_id"] == cid)]
-    if len(data["comments"]) != before:
-        save_json(COMMENTS, data)
+    comment = db.get("comments", cmid)
+    if comment and comment["course_id"] == cid:
+        db.delete("comments", cmid)
     return redirect(url_for("course_view", cid=cid))
 
 @app.get("/course/<int:cid>/edit")
 @teacher_required
 def course_edit(cid):
-    data = _load_courses()
-    course = _find_course(cid, data)
+    course = _find_course(cid)
     if not course:
         abort(404)
     return render_template("course_edit.html", course=course, user=current_user())
@@ -180,27 +325,18 @@ def course_edit(cid):
 def course_edit_save(cid):
     title = (request.form.get("title") or "").strip()
     description = (request.form.get("description") or "").strip()
-    data = _load_courses()
-    course = _find_course(cid, data)
-    if not course:
-        abort(404)
+    changes = {"description": description}
     if title:
-        course["title"] = title
-    course["description"] = description
-    _save_courses(data)
+        changes["title"] = title
+    if not db.update("courses", cid, changes):
+        abort(404)
     return redirect(url_for("course_view", cid=cid))
 
 @app.post("/course/<int:cid>/delete")
 @teacher_required
 def course_delete(cid):
-    data = _load_courses()
-    before = len(data["courses"])
-    data["courses"] = [c for c in data["courses"] if c["id"] != cid]
-    if len(data["courses"]) != before:
-        _save_courses(data)
-        comments = load_json(COMMENTS, {"comments": []})
-        comments["comments"] = [cm for cm in comments["comments"] if cm["course_id"] != cid]
-        save_json(COMMENTS, comments)
+    if db.delete("courses", cid):
+        db.delete_where("comments", "course_id", cid)
     return redirect(url_for("index"))
 
 # ----------------- login/logout -----------------
@@ -230,13 +366,12 @@ def logout():
 # ========== TASKS ==========
 @app.get("/course/<int:cid>/tasks")
 @login_required
+@cached_page("courses", "tasks")
 def task_list(cid):
     course = _find_course(cid)
     if not course:
         abort(404)
-    tasks_data = _load_tasks()
-    course_tasks = [t for t in tasks_data["tasks"] if t["course_id"] == cid]
-    return render_template("tasks.html", course=course, tasks=course_tasks, user=current_user())
+    return render_template("tasks.html", course=course, tasks=_course_tasks(cid), user=current_user())
 
 @app.get("/course/<int:cid>/task/add")
 @teacher_required
@@ -252,17 +387,12 @@ def task_add(cid):
     title = (request.form.get("title") or "").strip()
     description = (request.form.get("description") or "").strip()
     deadline = (request.form.get("deadline") or "").strip()
-    data = _load_tasks()
-    next_id = max((t["id"] for t in data["tasks"]), default=0) + 1
-    task = {
-        "id": next_id,
+    db.insert("tasks", {
         "course_id": cid,
         "title": title,
         "description": description,
         "deadline": deadline
-    }
-    data["tasks"].append(task)
-    _save_tasks(data)
+    })
     flash("Задание добавлено")
     return redirect(url_for("task_list", cid=cid))
 
@@ -273,10 +403,11 @@ def task_view(cid, tid):
     task = _find_task(tid)
     if not course or not task:
         abort(404)
-    subs = load_json(SUBMISSIONS, {"submissions": []})
-    answers = [s for s in subs["submissions"] if s["task_id"] == tid]
+    answers = _task_submissions(tid)
     user = current_user()
-    user_sub = next((s for s in answers if s["user_id"] == user["id"]), None)
+    user_sub = _find_submission(tid, user["id"])
+    if user["role"] == "teacher":
+        usernames_for(s["user_id"] for s in answers)
     return render_template("task_view.html", course=course, task=task, answers=answers, user=user, user_sub=user_sub)
 
 @app.post("/course/<int:cid>/task/<int:tid>/submit")
@@ -286,28 +417,53 @@ def task_submit(cid, tid):
     task = _find_task(tid)
     if not course or not task:
         abort(404)
-    if "file" not in request.files:
-        flash("Файл не выбран")
+    try:
+        file = request.files.get("file")
+    except RequestEntityTooLarge:
+        flash(f"Файл больше {app.config['MAX_UPLOAD_SIZE'] // (1024 * 1024)} МБ", "task")
         return redirect(url_for("task_view", cid=cid, tid=tid))
-    file = request.files["file"]
-    if file.filename == "":
-        flash("Файл не выбран")
+    if file is None or file.filename == "":
+        flash("Файл не выбран", "task")
         return redirect(url_for("task_view", cid=cid, tid=tid))
-    filename = f"{current_user()['id']}_{tid}_{file.filename}"
-    path = os.path.join(UPLOADS, filename)
-    file.save(path)
+    # имя файла только для отображения: на диске файл лежит под своим SHA-256
+    filename = os.path.basename(file.filename.replace("\\", "/"))
+    sha256, size = uploads.store(file)
 
-    data = load_json(SUBMISSIONS, {"submissions": []})
-    data["submissions"] = [s for s in data["submissions"] if not (s["user_id"] == current_user()["id"] and s["task_id"] == tid)]
-    data["submissions"].append({
+    db.upsert("submissions", {
         "user_id": current_user()["id"],
         "task_id": tid,
-        "filename": filename
+        "filename": filename,
+        "sha256": sha256,
+        "size": size,
     })
-    save_json(SUBMISSIONS, data)
-    flash("Ответ отправлен!")
+    flash("Ответ отправлен!", "task")
     return redirect(url_for("task_view", cid=cid, tid=tid))
 
+@app.get("/course/<int:cid>/task/<int:tid>/submission/<int:uid>/file")
+@login_required
+def submission_file(cid, tid, uid):
+    user = current_user()
+    if user["role"] != "teacher" and user["id"] != uid:
+        abort(403)
+    task = _find_task(tid)
+    sub = _find_submission(tid, uid)
+    if not task or task["course_id"] != cid or not sub:
+        abort(404)
+    if sub.get("sha256"):
+        path, etag = uploads.blob_path(UPLOADS, sub["sha256"]), sub["sha256"]
+    else:
+        # старые ответы лежат прямо в uploads/ под своим именем
+        path, etag = safe_join(UPLOADS, sub.get("filename") or ""), True
+    if not path or not os.path.isfile(path):
+        abort(404)
+    # send_file отвечает 304 на If-None-Match/If-Modified-Since, 206 на Range
+    # и отдаёт файл через wsgi.file_wrapper (sendfile), если сервер его даёт
+    resp = send_file(path, download_name=sub.get("filename") or os.path.basename(path),
+                     as_attachment=True, conditional=True, etag=etag)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
 @app.get("/course/<int:cid>/task/<int:tid>/grade/<int:uid>")
 @teacher_required
 def grade_form(cid, tid, uid):
@@ -315,8 +471,7 @@ def grade_form(cid, tid, uid):
     task = _find_task(tid)
     if not course or not task:
         abort(404)
-    subs = load_json(SUBMISSIONS, {"submissions": []})
-    sub = next((s for s in subs["submissions"] if s["task_id"] == tid and s["user_id"] == uid), None)
+    sub = _find_submission(tid, uid)
     if not sub:
         abort(404)
     return render_template("task_grade.html", course=course, task=task, sub=sub, user=current_user())
@@ -329,37 +484,224 @@ def grade_save(cid, tid, uid):
     if not course or not task:
         abort(404)
 
-    grade_raw = (request.form.get("grade") or "").strip()
     feedback = (request.form.get("feedback") or "").strip()
+    try:
+        grade = _parse_grade(request.form.get("grade"))
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for("grade_form", cid=cid, tid=tid, uid=uid))
+
+    found = db.update("submissions", (tid, uid), {
+        "grade": grade,
+        "feedback": feedback,
+        "graded_by": current_user()["id"],
+        "graded_at": datetime.now(timezone.utc).isoformat(),
+    })
+    if not found:
+        abort(404)
+
+    flash("Оценка сохранена", "task")
+    return redirect(url_for("task_view", cid=cid, tid=tid))
 
-    grade = None
-    if grade_raw != "":
+# ---------- Массовое выставление оценок ----------
+def _parse_grade(raw):
+    """Пустое значение снимает оценку (None), иначе целое 0–100; ошибка — ValueError с текстом."""
+    raw = "" if raw is None else str(raw).strip()
+    if raw == "":
+        return None
+    try:
+        grade = int(raw)
+    except ValueError:
+        raise ValueError("Оценка должна быть целым числом")
+    if grade < 0 or grade > 100:
+        raise ValueError("Оценка должна быть в диапазоне 0–100")
+    return grade
+
+def _grade_row_user(row):
+    if str(row.get("user_id") or "").strip():
         try:
-            grade = int(grade_raw)
+            return int(row["user_id"])
+        except (TypeError, ValueError):
+            raise ValueError("user_id должен быть целым числом")
+    name = str(row.get("username") or "").strip()
+    if not name:
+        raise ValueError("Не указан студент (user_id или username)")
+    user = get_user_by_username(name)
+    if not user:
+        raise ValueError(f"Пользователь {name} не найден")
+    return user["id"]
+
+def _apply_grades(tid, rows):
+    """Проверить строки [{user_id|username, grade, feedback?}] и записать все
+    корректные одной операцией. Возвращает (сколько сохранено, ошибки по строкам)."""
+    grader = current_user()["id"]
+    graded_at = datetime.now(timezone.utc).isoformat()
+    updates, errors = [], []
+    for n, row in enumerate(rows, 1):
+        try:
+            uid = _grade_row_user(row)
+            if "grade" not in row:
+                raise ValueError("Не указана оценка")
+            grade = _parse_grade(row["grade"])
+            if not _find_submission(tid, uid):
+                raise ValueError(f"Нет ответа студента {uid}")
+        except ValueError as e:
+            errors.append({"row": n, "error": str(e)})
+            continue
+        changes = {"grade": grade, "graded_by": grader, "graded_at": graded_at}
+        if row.get("feedback") is not None:
+            changes["feedback"] = str(row["feedback"]).strip()
+        updates.append(((tid, uid), changes))
+    if updates:
+        db.update_many("submissions", updates)
+    return len(updates), errors
+
+def _read_grades_file(file):
+    """Строки из загруженного .json (список объектов) или CSV (с заголовком;
+    разделитель , ; или табуляция)."""
+    try:
+        text = file.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("Файл должен быть в кодировке UTF-8")
+    if file.filename.lower().endswith(".json"):
+        try:
+            rows = json.loads(text)
         except ValueError:
-            flash("Оценка должна быть целым числом")
-            return redirect(url_for("grade_form", cid=cid, tid=tid, uid=uid))
-        if grade < 0 or grade > 100:
-            flash("Оценка должна быть в диапазоне 0–100")
-            return redirect(url_for("grade_form", cid=cid, tid=tid, uid=uid))
-
-    subs = load_json(SUBMISSIONS, {"submissions": []})
-    found = False
-    for s in subs["submissions"]:
-        if s["task_id"] == tid and s["user_id"] == uid:
-            s["grade"] = grade
-            s["feedback"] = feedback
-            s["graded_by"] = current_user()["id"]
-            s["graded_at"] = datetime.now(timezone.utc).isoformat()
-            found = True
-            break
+            raise ValueError("Некорректный JSON")
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise ValueError("JSON должен быть списком объектов")
+        return rows
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    return [{(k or "").strip().lower(): v for k, v in row.items()} for row in reader]
+
+@app.post("/api/tasks/<int:tid>/grades")
+@teacher_required
+def api_grades_bulk(tid):
+    if not _find_task(tid):
+        abort(404)
+    payload = request.get_json(force=True, silent=True)
+    rows = payload.get("grades") if isinstance(payload, dict) else payload
+    if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+        return jsonify({"error": "list of grades required"}), 400
+    updated, errors = _apply_grades(tid, rows)
+    return jsonify({"updated": updated, "errors": errors}), (400 if errors and not updated else 200)
+
+@app.post("/course/<int:cid>/task/<int:tid>/grades/import")
+@teacher_required
+def grades_import(cid, tid):
+    task = _find_task(tid)
+    if not _find_course(cid) or not task or task["course_id"] != cid:
+        abort(404)
+    file = request.files.get("file")
+    if file is None or file.filename == "":
+        flash("Файл не выбран", "task")
+        return redirect(url_for("task_view", cid=cid, tid=tid))
+    try:
+        rows = _read_grades_file(file)
+    except ValueError as e:
+        flash(str(e), "task")
+        return redirect(url_for("task_view", cid=cid, tid=tid))
+    updated, errors = _apply_grades(tid, rows)
+    # в CSV первая строка — заголовок, так что номер строки файла на 1 больше;
+    # в JSON номер — это позиция объекта в списке
+    header = 0 if file.filename.lower().endswith(".json") else 1
+    flash(f"Оценок сохранено: {updated}", "task")
+    for e in errors[:20]:
+        flash(f"Строка {e['row'] + header}: {e['error']}", "task")
+    if len(errors) > 20:
+        flash(f"…и ещё ошибок: {len(errors) - 20}", "task")
+    return redirect(url_for("task_view", cid=cid, tid=tid))
 
-    if not found:
+# ---------- Метрики ----------
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.exposition(), mimetype="text/plain; version=0.0.4")
+
+# ---------- Поиск ----------
+def _search(query, limit):
+    results = []
+    for kind, doc_id, score in search_index.search(query, limit):
+        if kind == "course":
+            course = _find_course(doc_id)
+            if course:
+                results.append({"kind": kind, "id": doc_id, "score": score, "title": course["title"],
+                                "text": course.get("description", ""),
+                                "url": url_for("course_view", cid=doc_id)})
+        elif kind == "task":
+            task = _find_task(doc_id)
+            if task:
+                results.append({"kind": kind, "id": doc_id, "score": score, "title": task["title"],
+                                "text": task.get("description", ""),
+                                "url": url_for("task_view", cid=task["course_id"], tid=doc_id)})
+        else:
+            comment = db.get("comments", doc_id)
+            course = comment and _find_course(comment["course_id"])
+            if course:
+                results.append({"kind": kind, "id": doc_id, "score": score, "title": course["title"],
+                                "text": comment["text"],
+                                "url": url_for("course_view", cid=course["id"])})
+    return results
+
+@app.get("/search")
+def search_page():
+    q = (request.args.get("q") or "").strip()
+    results = _search(q, 50) if q else []
+    return render_template("search.html", q=q, results=results, user=current_user())
+
+@app.get("/api/search")
+def api_search():
+    q = (request.args.get("q") or "").strip()
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), API_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify(_search(q, limit) if q else [])
+
+# ---------- Журнал оценок ----------
+@app.get("/course/<int:cid>/gradebook.csv")
+@teacher_required
+def gradebook_export(cid):
+    """Студенты × задания курса в CSV, строка за строкой.
+
+    ?format=excel — с BOM и разделителем «;», чтобы Excel открыл файл
+    с кириллицей без мастера импорта."""
+    if not _find_course(cid):
         abort(404)
+    excel = request.args.get("format") == "excel"
+    tasks = sorted(_course_tasks(cid), key=lambda t: t["id"])
+    task_ids = [t["id"] for t in tasks]
+
+    def rows():
+        buf = io.StringIO()
+        writer = csv.writer(buf, delimiter=";" if excel else ",")
+
+        def flush():
+            data = buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            return data
+
+        if excel:
+            buf.write("\ufeff")
+        writer.writerow(["user_id", "username"] + [t["title"] for t in tasks] + ["average"])
+        yield flush()
+        for u in db.iter_all("users"):
+            if u.get("role") != "student":
+                continue
+            subs = {s["task_id"]: s for s in _user_submissions(u["id"])}
+            grades = [subs[tid].get("grade") if tid in subs else None for tid in task_ids]
+            graded = [g for g in grades if isinstance(g, int)]
+            avg = round(sum(graded) / len(graded), 2) if graded else ""
+            writer.writerow([u["id"], u["username"]] + ["" if g is None else g for g in grades] + [avg])
+            yield flush()
 
-    save_json(SUBMISSIONS, subs)
-    flash("Оценка сохранена")
-    return redirect(url_for("task_view", cid=cid, tid=tid))
+    resp = Response(stream_with_context(rows()), mimetype="text/csv")
+    resp.headers["Content-Disposition"] = f"attachment; filename=gradebook_course_{cid}.csv"
+    return resp
 
 # ---------- Профиль ----------
 @app.get("/profile")
@@ -367,25 +709,14 @@ def grade_save(cid, tid, uid):
 def profile():
     user = current_user()
 
-    courses_data = _load_courses()
-    tasks_data = _load_tasks()
-    subs_data = load_json(SUBMISSIONS, {"submissions": []})
-
-    course_by_id = {c["id"]: c for c in courses_data["courses"]}
-    tasks_by_course = {}
-    for t in tasks_data["tasks"]:
-        tasks_by_course.setdefault(t["course_id"], []).append(t)
-
     student_rows = []
     if user["role"] == "student":
-        for s in subs_data["submissions"]:
-            if s["user_id"] != user["id"]:
-                continue
-
-            task = next((t for t in tasks_data["tasks"] if t["id"] == s["task_id"]), None)
+        student = stats.student(user["id"])
+        for s in student["subs"]:
+            task = _find_task(s["task_id"])
             if not task:
                 continue
-            course = course_by_id.get(task["course_id"])
+            course = _find_course(task["course_id"])
             student_rows.append({
                 "course": course["title"] if course else f"course#{task['course_id']}",
                 "task": task["title"],
@@ -396,26 +727,19 @@ def profile():
                 "course_id": task["course_id"],
             })
 
-        graded = [r["grade"] for r in student_rows if isinstance(r.get("grade"), int)]
-        avg_grade = round(sum(graded) / len(graded), 2) if graded else None
+        avg_grade = student["avg_grade"]
     else:
         avg_grade = None
 
     teacher_courses = []
     if user["role"] == "teacher":
-        for c in courses_data["courses"]:
-            course_tasks = tasks_by_course.get(c["id"], [])
-
-            course_task_ids = {t["id"] for t in course_tasks}
-            course_subs = [s for s in subs_data["submissions"] if s["task_id"] in course_task_ids]
-            pending = [s for s in course_subs if s.get("grade") is None]
+        for c in db.all("courses"):
             teacher_courses.append({
                 "course": c,
-                "tasks_count": len(course_tasks),
-                "subs_count": len(course_subs),
-                "pending_count": len(pending),
-                "pending": pending[:10],
+                "tasks_count": len(_course_tasks(c["id"])),
+                **stats.course(c["id"]),
             })
+        usernames_for(s["user_id"] for row in teacher_courses for s in row["pending"])
 
     return render_template(
         "profile.html",
@@ -423,7 +747,6 @@ def profile():
         student_rows=student_rows,
         avg_grade=avg_grade,
         teacher_courses=teacher_courses,
-        username=lambda uid: get_user_by_id(uid)["username"] if get_user_by_id(uid) else f"user#{uid}",
     )
 
 @app.context_processor
@@ -432,10 +755,19 @@ def utility_processor():
 
 @app.context_processor
 def inject_utils():
-    def username(uid):
-        u = get_user_by_id(uid)
-        return u["username"] if u else f"user#{uid}"
     return {"username": username}
 
+@app.cli.command("migrate-sqlite")
+def migrate_sqlite_command():
+    """Copy the JSON data files into the SQLite database (MOODLE_DB)."""
+    for name, count in migrate_json_to_sqlite(DATA_DIR, DB_PATH).items():
+        print(f"{name}: {count}")
+
+@app.cli.command("compact-journal")
+def compact_journal_command():
+    """Fold the comments/submissions journals back into their JSON files."""
+    if STORAGE == "json":
+        db.compact()
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
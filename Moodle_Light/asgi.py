@@ -0,0 +1,142 @@
+"""ASGI entry point: ``uvicorn asgi:application``.
+
+Connections live on the event loop: request bodies are received and
+responses sent asynchronously, so slow clients, uploads in flight and idle
+keep-alive connections hold no thread. Only the Flask view itself (storage
+I/O, fsync, template rendering) runs, in a bounded thread pool of
+MOODLE_IO_THREADS threads."""
+import asyncio, contextvars, os, sys, tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from app import app
+
+IO_THREADS = int(os.getenv("MOODLE_IO_THREADS", "16"))
+SPOOL_SIZE = 1024 * 1024  # request bodies above this go to a temp file
+
+executor = ThreadPoolExecutor(IO_THREADS, thread_name_prefix="moodle-io")
+
+def _environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "wsgi.input_terminated": True,
+    }
+    for name, value in scope["headers"]:
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-length":
+            key = "CONTENT_LENGTH"
+        elif name == "content-type":
+            key = "CONTENT_TYPE"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = environ[key] + "," + value if key in environ else value
+    # the body is spooled whole (and de-chunked by the server): its length is
+    # known even when the client sent Transfer-Encoding: chunked
+    environ["CONTENT_LENGTH"] = str(body.seek(0, os.SEEK_END))
+    body.seek(0)
+    return environ
+
+def _start(environ):
+    """Run the Flask app up to its first body chunk (called in the pool)."""
+    response = {}
+    def start_response(status, headers, exc_info=None):
+        response["status"], response["headers"] = status, headers
+    result = app(environ, start_response)
+    chunks = iter(result)
+    first = next(chunks, None)
+    return response, result, chunks, first
+
+async def _read_body(receive, limit):
+    """Request body as a file, or None if it exceeds ``limit`` / the client left."""
+    loop = asyncio.get_running_loop()
+    body = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            body.close()
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if limit is not None and size > limit:
+            body.close()
+            return None
+        if size > SPOOL_SIZE:
+            await loop.run_in_executor(executor, body.write, chunk)
+        else:
+            body.write(chunk)
+        if not message.get("more_body"):
+            body.seek(0)
+            return body
+
+async def _send_too_large(send):
+    response = RequestEntityTooLarge().get_response()
+    await send({"type": "http.response.start", "status": response.status_code,
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1"))
+                            for k, v in response.headers.to_wsgi_list()]})
+    await send({"type": "http.response.body", "body": response.get_data()})
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            executor.shutdown(wait=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    limit = app.config.get("MAX_CONTENT_LENGTH")
+    declared = dict(scope["headers"]).get(b"content-length")
+    if limit is not None and declared and declared.isdigit() and int(declared) > limit:
+        return await _send_too_large(send)
+    body = await _read_body(receive, limit)
+    if body is None:
+        return await _send_too_large(send)
+
+    loop = asyncio.get_running_loop()
+    # one context per request: streamed responses (stream_with_context) keep
+    # the request context in context variables across pool threads
+    context = contextvars.copy_context()
+    def call(fn, *args):
+        return loop.run_in_executor(executor, context.run, fn, *args)
+
+    try:
+        response, result, chunks, chunk = await call(_start, _environ(scope, body))
+        try:
+            await send({"type": "http.response.start", "status": int(response["status"].split()[0]),
+                        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1"))
+                                    for k, v in response["headers"]]})
+            while chunk is not None:
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                # any free pool thread resumes the iterator, so it must not
+                # rely on thread-local state (see SqliteStorage.iter_all)
+                chunk = await call(next, chunks, None)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                await call(result.close)
+    finally:
+        body.close()
@@ -0,0 +1,281 @@
+"""Load test for every route of app.py on a synthetic dataset.
+
+    python bench.py --scale medium --storage sqlite --save baseline.json
+    python bench.py --scale medium --storage sqlite --baseline baseline.json
+
+Builds the dataset in a temporary MOODLE_DATA_DIR, drives each route through
+Flask's test client from --concurrency threads (one logged-in client per
+thread) and prints p50/p95/p99 latency and throughput per route. With
+--baseline the run fails (exit code 1) when a route's p95 is more than
+--tolerance slower than in the saved run, or when any request failed."""
+import argparse, hashlib, io, itertools, json, os, random, shutil, sys, tempfile, threading, time
+
+SCALES = {
+    #          users  courses  tasks  submissions  comments
+    "small":  (50,    10,      50,    500,         200),
+    "medium": (500,   50,      500,   10000,       2000),
+    "large":  (5000,  200,     2000,  100000,      20000),
+}
+WORDS = ("математика анализ алгебра физика механика оптика программирование python "
+         "алгоритмы структуры данных базы sql сети история философия экономика "
+         "лабораторная работа отчёт задача проект эссе тест семинар лекция "
+         "function matrix graph vector integral limit theorem proof").split()
+PASSWORD = "bench"
+BLOB = b"benchmark submission\n" * 64
+
+def _text(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+def generate(data_dir, users, courses, tasks, submissions, comments, seed=1):
+    """Write users/courses/tasks/submissions/comments JSON files and one upload blob."""
+    rng = random.Random(seed)
+    teachers = max(1, users // 20)
+    user_rows = [{"id": i, "username": f"teacher{i}" if i <= teachers else f"student{i}",
+                  "password": PASSWORD, "role": "teacher" if i <= teachers else "student"}
+                 for i in range(1, users + 1)]
+    course_rows = [{"id": i, "title": _text(rng, 3).capitalize(), "description": _text(rng, 12)}
+                   for i in range(1, courses + 1)]
+    task_rows = [{"id": i, "course_id": rng.randint(1, courses), "title": _text(rng, 4).capitalize(),
+                  "description": _text(rng, 20), "deadline": f"{rng.randint(1, 28):02d}.12.2025"}
+                 for i in range(1, tasks + 1)]
+    sha256 = hashlib.sha256(BLOB).hexdigest()
+    blob = os.path.join(data_dir, "uploads", "blobs", sha256[:2], sha256)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    with open(blob, "wb") as f:
+        f.write(BLOB)
+    students = range(teachers + 1, users + 1)
+    pairs = set()
+    submissions = min(submissions, tasks * len(students))
+    while len(pairs) < submissions:
+        pairs.add((rng.randint(1, tasks), rng.choice(students)))
+    sub_rows = []
+    for tid, uid in sorted(pairs):
+        sub = {"task_id": tid, "user_id": uid, "filename": "answer.txt", "sha256": sha256, "size": len(BLOB)}
+        if rng.random() < 0.5:
+            sub.update(grade=rng.randint(0, 100), feedback=_text(rng, 5), graded_by=1)
+        sub_rows.append(sub)
+    comment_rows = [{"id": i, "course_id": rng.randint(1, courses), "user_id": rng.randint(1, users),
+                     "text": _text(rng, 10)} for i in range(1, comments + 1)]
+    for name, rows in (("users", user_rows), ("courses", course_rows), ("tasks", task_rows),
+                       ("submissions", sub_rows), ("comments", comment_rows)):
+        with open(os.path.join(data_dir, name + ".json"), "w", encoding="utf-8") as f:
+            json.dump({name: rows}, f, ensure_ascii=False)
+    return {"teachers": teachers, "tasks": task_rows, "submissions": sub_rows, "comments": comment_rows,
+            "courses": courses, "users": users}
+
+def routes(data):
+    """(name, role, request factory); a factory takes rng and returns (method, url, kwargs)."""
+    tasks, subs = data["tasks"], data["submissions"]
+    students = range(data["teachers"] + 1, data["users"] + 1)
+    comments = iter(data["comments"])  # each delete request removes a different comment
+    course_ids = itertools.count(data["courses"] + 1)  # courses created by add_course
+
+    def course(rng):
+        return rng.randint(1, data["courses"])
+    def task_url(rng, suffix=""):
+        t = rng.choice(tasks)
+        return f"/course/{t['course_id']}/task/{t['id']}{suffix}"
+    def sub_url(rng, suffix):
+        s = rng.choice(subs)
+        t = tasks[s["task_id"] - 1]
+        return f"/course/{t['course_id']}/task/{t['id']}/{suffix}/{s['user_id']}"
+    def upload(rng):
+        return {"file": (io.BytesIO(_text(rng, 50).encode()), "answer.txt")}
+    def grades_csv(rng):
+        rows = "".join(f"{s['user_id']},{rng.randint(0, 100)},ok\n" for s in rng.sample(subs, 5))
+        return {"file": (io.BytesIO(("user_id,grade,feedback\n" + rows).encode()), "grades.csv")}
+    def bulk_grades(rng):
+        s = rng.choice(subs)
+        return ("POST", f"/api/tasks/{s['task_id']}/grades",
+                {"json": [{"user_id": s["user_id"], "grade": rng.randint(0, 100)}]})
+    def delete_comment(rng):
+        c = next(comments)
+        return "POST", f"/course/{c['course_id']}/comment/{c['id']}/delete", {}
+    multipart = {"content_type": "multipart/form-data"}
+
+    return [
+        ("GET /", None, lambda r: ("GET", "/", {})),
+        ("GET / (student)", "student", lambda r: ("GET", "/", {})),
+        ("GET /login", None, lambda r: ("GET", "/login", {})),
+        ("POST /login", None, lambda r: ("POST", "/login",
+                                         {"data": {"username": f"student{r.choice(students)}", "password": PASSWORD}})),
+        ("POST /logout", "student", lambda r: ("POST", "/logout", {})),
+        ("GET /course/<cid>", "student", lambda r: ("GET", f"/course/{course(r)}", {})),
+        ("GET /course/<cid>/tasks", "student", lambda r: ("GET", f"/course/{course(r)}/tasks", {})),
+        ("GET /course/<cid>/task/<tid>", "student", lambda r: ("GET", task_url(r), {})),
+        ("GET /course/<cid>/task/<tid> (teacher)", "teacher", lambda r: ("GET", task_url(r), {})),
+        ("GET /profile", "student", lambda r: ("GET", "/profile", {})),
+        ("GET /profile (teacher)", "teacher", lambda r: ("GET", "/profile", {})),
+        ("GET /search", "student", lambda r: ("GET", f"/search?q={r.choice(WORDS)}", {})),
+        ("GET /api/search", "student", lambda r: ("GET", f"/api/search?q={r.choice(WORDS)}+{r.choice(WORDS)}", {})),
+        ("GET /api/courses", None, lambda r: ("GET", "/api/courses", {})),
+        ("GET /api/courses/<cid>/tasks", None, lambda r: ("GET", f"/api/courses/{course(r)}/tasks", {})),
+        ("GET /api/tasks/<tid>/submissions", "teacher",
+         lambda r: ("GET", f"/api/tasks/{r.choice(tasks)['id']}/submissions", {})),
+        ("GET /course/<cid>/gradebook.csv", "teacher", lambda r: ("GET", f"/course/{course(r)}/gradebook.csv", {})),
+        ("GET .../submission/<uid>/file", "teacher", lambda r: ("GET", sub_url(r, "submission") + "/file", {})),
+        ("GET .../grade/<uid>", "teacher", lambda r: ("GET", sub_url(r, "grade"), {})),
+        ("GET /course/<cid>/edit", "teacher", lambda r: ("GET", f"/course/{course(r)}/edit", {})),
+        ("GET /course/<cid>/task/add", "teacher", lambda r: ("GET", f"/course/{course(r)}/task/add", {})),
+        ("POST /course/<cid>/comment", "student",
+         lambda r: ("POST", f"/course/{course(r)}/comment", {"data": {"text": _text(r, 10)}})),
+        ("POST .../task/<tid>/submit", "student",
+         lambda r: ("POST", task_url(r, "/submit"), dict(multipart, data=upload(r)))),
+        ("POST .../grade/<uid>", "teacher",
+         lambda r: ("POST", sub_url(r, "grade"), {"data": {"grade": str(r.randint(0, 100)), "feedback": "ok"}})),
+        ("POST /api/tasks/<tid>/grades", "teacher", bulk_grades),
+        ("POST .../grades/import", "teacher",
+         lambda r: ("POST", task_url(r, "/grades/import"), dict(multipart, data=grades_csv(r)))),
+        ("POST /course/<cid>/edit", "teacher",
+         lambda r: ("POST", f"/course/{course(r)}/edit", {"data": {"title": _text(r, 3), "description": _text(r, 12)}})),
+        ("POST /course/<cid>/task/add", "teacher",
+         lambda r: ("POST", f"/course/{course(r)}/task/add",
+                    {"data": {"title": _text(r, 4), "description": _text(r, 20), "deadline": ""}})),
+        ("POST /api/courses", "teacher", lambda r: ("POST", "/api/courses", {"json": {"title": _text(r, 3)}})),
+        ("POST /add_course", "teacher", lambda r: ("POST", "/add_course", {"data": {"title": _text(r, 3)}})),
+        # deletes go last: they remove generated comments and the courses added above
+        ("POST .../comment/<cmid>/delete", "teacher", delete_comment),
+        ("POST /course/<cid>/delete", "teacher", lambda r: ("POST", f"/course/{next(course_ids)}/delete", {})),
+    ]
+
+def _client(app, role, data):
+    client = app.test_client()
+    if role:
+        uid = 1 if role == "teacher" else data["teachers"] + 1
+        resp = client.post("/login", data={"username": f"{role}{uid}", "password": PASSWORD})
+        assert resp.status_code == 302, f"login as {role}{uid} failed"
+    return client
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+def run(app, data, requests, concurrency, seed=1, only=None, warmup=10):
+    results = {}
+    for name, role, make in routes(data):
+        if only and only not in name:
+            continue
+        # untimed first hits fill caches and compile templates
+        client = _client(app, role, data)
+        rng = random.Random(f"{seed}:{name}:warmup")
+        for _ in range(warmup):
+            method, url, kwargs = make(rng)
+            client.open(url, method=method, **kwargs).close()
+            if name == "POST /logout":
+                client = _client(app, role, data)
+
+        latencies, errors = [], []
+        lock = threading.Lock()
+        per_thread = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+        clients = [_client(app, role, data) for _ in per_thread]
+        def worker(i, n):
+            rng = random.Random(f"{seed}:{name}:{i}")
+            client = clients[i]
+            for _ in range(n):
+                method, url, kwargs = make(rng)
+                start = time.perf_counter()
+                resp = client.open(url, method=method, **kwargs)
+                resp.close()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if resp.status_code >= 400:
+                        errors.append(f"{method} {url} -> {resp.status_code}")
+                if name == "POST /logout":
+                    client = _client(app, role, data)
+        threads = [threading.Thread(target=worker, args=(i, n)) for i, n in enumerate(per_thread) if n]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - start
+        latencies.sort()
+        results[name] = {
+            "requests": len(latencies), "errors": len(errors), "first_error": errors[0] if errors else None,
+            "rps": round(len(latencies) / wall, 1) if wall else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        }
+    return results
+
+def report(results, baseline=None):
+    width = max(len(name) for name in results)
+    print(f"{'route':<{width}}  {'req':>5} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+          + ("  p95 vs baseline" if baseline else ""))
+    for name, r in results.items():
+        line = f"{name:<{width}}  {r['requests']:>5} {r['errors']:>4} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}"
+        base = (baseline or {}).get(name)
+        if base and base["p95_ms"]:
+            line += f"  {(r['p95_ms'] / base['p95_ms'] - 1) * 100:+.0f}%"
+        print(line)
+
+def regressions(results, baseline, tolerance, min_ms=2.0):
+    """Routes whose p95 grew by more than ``tolerance`` (and by at least min_ms) or that had errors."""
+    failed = []
+    for name, r in results.items():
+        if r["errors"]:
+            failed.append(f"{name}: {r['errors']} failed requests, e.g. {r['first_error']}")
+        base = baseline.get(name)
+        if base and r["p95_ms"] > base["p95_ms"] * (1 + tolerance) and r["p95_ms"] - base["p95_ms"] >= min_ms:
+            failed.append(f"{name}: p95 {base['p95_ms']} -> {r['p95_ms']} ms")
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    for name in ("users", "courses", "tasks", "submissions", "comments"):
+        parser.add_argument(f"--{name}", type=int, help=f"override the scale's number of {name}")
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--route", help="only routes whose name contains this text")
+    parser.add_argument("--save", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare with results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 growth (0.25 = +25%%)")
+    parser.add_argument("--keep", action="store_true", help="keep the generated data directory")
+    args = parser.parse_args(argv)
+
+    counts = dict(zip(("users", "courses", "tasks", "submissions", "comments"), SCALES[args.scale]))
+    counts.update({k: getattr(args, k) for k in counts if getattr(args, k) is not None})
+    data_dir = tempfile.mkdtemp(prefix="moodle-bench.")
+    try:
+        data = generate(data_dir, seed=args.seed, **counts)
+        os.environ.update(MOODLE_DATA_DIR=data_dir, MOODLE_STORAGE=args.storage)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        if args.storage == "sqlite":
+            from service import migrate_json_to_sqlite
+            migrate_json_to_sqlite(data_dir, os.path.join(data_dir, "moodle.db"))
+        from app import app
+
+        config = dict(counts, scale=args.scale, storage=args.storage, requests=args.requests,
+                      concurrency=args.concurrency, seed=args.seed)
+        print("dataset:", ", ".join(f"{k}={v}" for k, v in config.items()), flush=True)
+        results = run(app, data, args.requests, args.concurrency, args.seed, args.route)
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved["config"] != config:
+                print(f"warning: baseline was run with {saved['config']}", file=sys.stderr)
+            baseline = saved["routes"]
+        report(results, baseline)
+        if args.save:
+            with open(args.save, "w", encoding="utf-8") as f:
+                json.dump({"config": config, "routes": results}, f, ensure_ascii=False, indent=2)
+        failed = regressions(results, baseline or {}, args.tolerance)
+        for line in failed:
+            print("FAIL", line, file=sys.stderr)
+        return 1 if failed else 0
+    finally:
+        app_module = sys.modules.get("app")
+        if app_module is not None:
+            app_module.search_index.save()  # before its directory goes away
+        if args.keep:
+            print("data kept in", data_dir)
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
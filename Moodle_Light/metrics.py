@@ -0,0 +1,177 @@
+import threading, time
+from contextvars import ContextVar
+
+# Where request time goes. "load"/"save" are load_json/save_json (and the
+# journal reads/appends behind them), "parse" the part of "load" spent
+# parsing files, "sql" SQLite statements, "render" Jinja templates and
+# "lock" waiting for storage locks.
+KINDS = ("load", "parse", "save", "sql", "render", "lock")
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class RequestStats:
+    """What one request spent; filled in by observe() from whatever thread runs it."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.seconds = dict.fromkeys(KINDS, 0.0)
+        self.counts = dict.fromkeys(KINDS, 0)
+        self.bytes_read = self.bytes_written = 0
+        self.render_started = None
+
+_current = ContextVar("moodle_request_stats", default=None)
+
+_lock = threading.Lock()
+_seconds = {}    # (endpoint, kind) -> seconds
+_counts = {}     # (endpoint, kind) -> operations
+_bytes = {}      # (endpoint, "read"|"write") -> bytes
+_requests = {}   # (endpoint, method, status) -> requests
+_durations = {}  # endpoint -> [bucket counts..., +Inf count, sum]
+
+def observe(kind, seconds, count=1, read=0, written=0):
+    """Record storage/render work: on the current request if there is one,
+    otherwise (startup, CLI, background threads) straight into the totals."""
+    stats = _current.get()
+    if stats is None:
+        with _lock:
+            _add("-", kind, seconds, count)
+            _add_bytes("-", read, written)
+        return
+    stats.seconds[kind] += seconds
+    stats.counts[kind] += count
+    stats.bytes_read += read
+    stats.bytes_written += written
+
+def _add(endpoint, kind, seconds, count):
+    _seconds[endpoint, kind] = _seconds.get((endpoint, kind), 0.0) + seconds
+    _counts[endpoint, kind] = _counts.get((endpoint, kind), 0) + count
+
+def _add_bytes(endpoint, read, written):
+    if read:
+        _bytes[endpoint, "read"] = _bytes.get((endpoint, "read"), 0) + read
+    if written:
+        _bytes[endpoint, "write"] = _bytes.get((endpoint, "write"), 0) + written
+
+def begin():
+    return _current.set(RequestStats())
+
+def end(token):
+    _current.reset(token)
+
+def current():
+    return _current.get()
+
+def finish(stats, endpoint, method, status):
+    """Fold a finished request into the totals; returns its duration in seconds."""
+    duration = time.perf_counter() - stats.start
+    with _lock:
+        for kind in KINDS:
+            if stats.counts[kind]:
+                _add(endpoint, kind, stats.seconds[kind], stats.counts[kind])
+        _add_bytes(endpoint, stats.bytes_read, stats.bytes_written)
+        _requests[endpoint, method, status] = _requests.get((endpoint, method, status), 0) + 1
+        hist = _durations.setdefault(endpoint, [0] * (len(BUCKETS) + 1) + [0.0])
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                hist[i] += 1
+        hist[len(BUCKETS)] += 1
+        hist[-1] += duration
+    return duration
+
+def server_timing(stats, duration):
+    """Server-Timing header value for one request (durations in ms)."""
+    parts = []
+    for kind in KINDS:
+        if stats.counts[kind]:
+            desc = f"{stats.counts[kind]} files" if kind == "parse" else f"{stats.counts[kind]} calls"
+            parts.append(f'{kind};desc="{desc}";dur={stats.seconds[kind] * 1000:.2f}')
+    if stats.bytes_read or stats.bytes_written:
+        parts.append(f'bytes;desc="read {stats.bytes_read} B, written {stats.bytes_written} B"')
+    parts.append(f"total;dur={duration * 1000:.2f}")
+    return ", ".join(parts)
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def exposition():
+    """All totals in the Prometheus text format."""
+    with _lock:
+        seconds, counts, nbytes = dict(_seconds), dict(_counts), dict(_bytes)
+        requests = dict(_requests)
+        durations = {k: list(v) for k, v in _durations.items()}
+    lines = [
+        "# HELP moodle_requests_total Requests served, by endpoint, method and status.",
+        "# TYPE moodle_requests_total counter",
+    ]
+    for (endpoint, method, status), n in sorted(requests.items()):
+        lines.append(f'moodle_requests_total{{endpoint="{_label(endpoint)}",method="{method}",status="{status}"}} {n}')
+    lines += [
+        "# HELP moodle_request_duration_seconds Request handling time, by endpoint.",
+        "# TYPE moodle_request_duration_seconds histogram",
+    ]
+    for endpoint, hist in sorted(durations.items()):
+        label = f'endpoint="{_label(endpoint)}"'
+        for bound, n in zip(BUCKETS, hist):
+            lines.append(f'moodle_request_duration_seconds_bucket{{{label},le="{bound}"}} {n}')
+        lines.append(f'moodle_request_duration_seconds_bucket{{{label},le="+Inf"}} {hist[len(BUCKETS)]}')
+        lines.append(f"moodle_request_duration_seconds_sum{{{label}}} {hist[-1]:.6f}")
+        lines.append(f"moodle_request_duration_seconds_count{{{label}}} {hist[len(BUCKETS)]}")
+    lines += [
+        "# HELP moodle_work_seconds_total Time spent in storage, parsing, rendering and lock waits "
+        '(endpoint "-" is work outside requests).',
+        "# TYPE moodle_work_seconds_total counter",
+    ]
+    for (endpoint, kind), value in sorted(seconds.items()):
+        if counts.get((endpoint, kind)):
+            lines.append(f'moodle_work_seconds_total{{endpoint="{_label(endpoint)}",kind="{kind}"}} {value:.6f}')
+    lines += [
+        "# HELP moodle_work_operations_total Storage calls, parsed files, rendered templates and lock acquisitions.",
+        "# TYPE moodle_work_operations_total counter",
+    ]
+    for (endpoint, kind), value in sorted(counts.items()):
+        if value:
+            lines.append(f'moodle_work_operations_total{{endpoint="{_label(endpoint)}",kind="{kind}"}} {value}')
+    lines += [
+        "# HELP moodle_storage_bytes_total Bytes read from and written to data files.",
+        "# TYPE moodle_storage_bytes_total counter",
+    ]
+    for (endpoint, direction), value in sorted(nbytes.items()):
+        lines.append(f'moodle_storage_bytes_total{{endpoint="{_label(endpoint)}",direction="{direction}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+def init_app(app, server_timing_header=False):
+    """Track every request of ``app``; with ``server_timing_header`` also send
+    each request's breakdown in a Server-Timing response header."""
+    from flask import before_render_template, request, template_rendered
+
+    @app.before_request
+    def _metrics_begin():
+        request.environ["moodle.metrics"] = begin()
+
+    @app.after_request
+    def _metrics_finish(response):
+        stats = current()
+        if stats is not None:
+            duration = finish(stats, request.endpoint or "unmatched", request.method, response.status_code)
+            if server_timing_header:
+                response.headers["Server-Timing"] = server_timing(stats, duration)
+        return response
+
+    @app.teardown_request
+    def _metrics_end(exc):
+        token = request.environ.pop("moodle.metrics", None)
+        if token is not None:
+            end(token)
+
+    def _render_begin(sender, **extra):
+        stats = current()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+
+    def _render_end(sender, **extra):
+        stats = current()
+        if stats is not None and stats.render_started is not None:
+            observe("render", time.perf_counter() - stats.render_started)
+            stats.render_started = None
+
+    before_render_template.connect(_render_begin, app, weak=False)
+    template_rendered.connect(_render_end, app, weak=False)
@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+
+class PageCache:
+    """LRU cache of rendered pages.
+
+    Every entry remembers the collections it was rendered from and their
+    versions: a write through the storage evicts the dependent entries at
+    once, and a write made by another process is caught by the version
+    check on the next hit."""
+
+    def __init__(self, db, maxsize=256):
+        self.db = db
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (collections, versions, body)
+        self._subscribed = set()
+        self.hits = self.misses = 0
+
+    def _subscribe(self, name):
+        if name not in self._subscribed:
+            self._subscribed.add(name)
+            self.db.subscribe(name, self._evicter(name))
+
+    def _evicter(self, name):
+        def on_change(changes, before, after):
+            with self._lock:
+                for key in [k for k, entry in self._entries.items() if name in entry[0]]:
+                    del self._entries[key]
+        return on_change
+
+    def get_or_render(self, key, collections, render):
+        """Cached body for ``key`` or ``render()``, stored if nothing changed meanwhile."""
+        if self.maxsize <= 0:
+            return render()
+        versions = tuple(self.db.version(name) for name in collections)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == versions:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            for name in collections:
+                self._subscribe(name)
+        body = render()
+        # a write during rendering may already be in the body; keep the entry
+        # only if the versions it is stored under are still current
+        if versions != tuple(self.db.version(name) for name in collections):
+            return body
+        with self._lock:
+            self._entries[key] = (collections, versions, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,208 @@
+import atexit, json, math, os, re, tempfile, threading
+
+SAVE_EVERY = 100  # changes between saves of the index file
+
+# What gets indexed: collection -> (document kind, [(field, weight), ...])
+SOURCES = {
+    "courses": ("course", [("title", 3), ("description", 1)]),
+    "tasks": ("task", [("title", 3), ("description", 1)]),
+    "comments": ("comment", [("text", 1)]),
+}
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+# common inflection endings, longest first; stripped only from long words so
+# that "курсы"/"курса"/"курсов" and "tasks"/"task" meet at one term
+_ENDINGS = sorted("""
+    иями ями ами ого его ому ему ыми ими ией
+    ах ях ов ев ей ой ом ем ам ям ую юю ая яя ое ее ые ие ый ий ых их
+    а я о е ы и у ю ь й
+    ing ed es s
+""".split(), key=len, reverse=True)
+
+def tokenize(text):
+    terms = []
+    for word in _WORD.findall((text or "").lower().replace("ё", "е")):
+        if len(word) > 4:
+            for ending in _ENDINGS:
+                if word.endswith(ending) and len(word) - len(ending) >= 3:
+                    word = word[:-len(ending)]
+                    break
+        terms.append(word)
+    return terms
+
+class SearchIndex:
+    """Inverted index over course, task and comment text, ranked with BM25.
+
+    Kept current from storage change events and saved to ``path`` together
+    with the collection versions it reflects; at startup the saved index is
+    reused when those versions still match, otherwise it is rebuilt. Saves
+    run in a background thread after a rebuild, every SAVE_EVERY changes and
+    at exit, never on a request or inside a writer's file lock."""
+
+    K1, B = 1.2, 0.75
+
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self._lock = threading.Lock()
+        self._postings = {}  # term -> {doc: weighted term frequency}
+        self._lengths = {}   # doc -> weighted length; doc = "kind:id"
+        self._seen = {}      # collection -> version the index reflects
+        self._changes = 0   # changes since the last save
+        self._save_lock = threading.Lock()  # one save at a time, in order
+        self._dirty = threading.Event()     # SAVE_EVERY changes are waiting
+        self._saver = None
+        for name in SOURCES:
+            db.subscribe(name, self._handler(name))
+        self._load()
+        atexit.register(self.save)
+
+    # ----- maintenance -----
+    def _doc_id(self, name, row):
+        return f"{SOURCES[name][0]}:{row['id']}"
+
+    def _add(self, name, row):
+        doc = self._doc_id(name, row)
+        length = 0
+        for field, weight in SOURCES[name][1]:
+            for term in tokenize(row.get(field)):
+                postings = self._postings.setdefault(term, {})
+                postings[doc] = postings.get(doc, 0) + weight
+                length += weight
+        self._lengths[doc] = length
+
+    def _remove(self, name, row):
+        doc = self._doc_id(name, row)
+        if self._lengths.pop(doc, None) is None:
+            return
+        for field, _ in SOURCES[name][1]:
+            for term in tokenize(row.get(field)):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(doc, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def _handler(self, name):
+        def on_change(changes, before, after):
+            with self._lock:
+                if self._seen.get(name) != str(before):
+                    self._seen[name] = None
+                    return
+                for old, new in changes:
+                    if old is not None:
+                        self._remove(name, old)
+                    if new is not None:
+                        self._add(name, new)
+                self._seen[name] = str(after)
+                self._changed()
+        return on_change
+
+    def _changed(self):
+        # called with self._lock held
+        self._changes += 1
+        if self._changes >= SAVE_EVERY:
+            self._save_soon()
+
+    def _save_soon(self):
+        if self._saver is None or not self._saver.is_alive():  # not started, or lost in a fork
+            self._saver = threading.Thread(target=self._save_loop, name="search-index-save", daemon=True)
+            self._saver.start()
+        self._dirty.set()
+
+    def _save_loop(self):
+        while True:
+            self._dirty.wait()
+            self._dirty.clear()
+            self.save()
+
+    def _sync(self):
+        rebuilt = False
+        for name in SOURCES:
+            version = str(self.db.version(name))
+            if self._seen.get(name) == version:
+                continue
+            kind = SOURCES[name][0] + ":"
+            for doc in [d for d in self._lengths if d.startswith(kind)]:
+                del self._lengths[doc]
+            for term in list(self._postings):
+                postings = self._postings[term]
+                for doc in [d for d in postings if d.startswith(kind)]:
+                    del postings[doc]
+                if not postings:
+                    del self._postings[term]
+            for row in self.db.iter_all(name):
+                self._add(name, row)
+            # rows first, version second (see SubmissionStats._sync)
+            self._seen[name] = str(self.db.version(name))
+            self._changes += 1
+            rebuilt = True
+        if rebuilt:
+            # a rebuild is worth saving at once, not as one change of SAVE_EVERY:
+            # a worker killed before exit would otherwise rebuild again
+            self._save_soon()
+
+    # ----- persistence -----
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._postings, self._lengths, self._seen = data["postings"], data["lengths"], data["versions"]
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        with self._lock:
+            self._sync()
+
+    def save(self):
+        with self._save_lock:
+            # copy under the lock (the postings' dicts change in place),
+            # serialize and write without it
+            with self._lock:
+                if not self._changes:
+                    return
+                data = {"versions": dict(self._seen), "lengths": dict(self._lengths),
+                        "postings": {term: dict(docs) for term, docs in self._postings.items()}}
+                self._changes = 0
+            self._write(data)
+
+    def _write(self, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", prefix="tmp.", suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        finally:
+            if os.path.exists(tmp):
+                try: os.remove(tmp)
+                except OSError: pass
+
+    # ----- queries -----
+    def search(self, query, limit=20):
+        """[(kind, id, score)] best first; every query term must match."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            self._sync()
+            n = len(self._lengths) or 1
+            avg_len = sum(self._lengths.values()) / n
+            scores = None
+            for term in terms:
+                postings = self._postings.get(term, {})
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                term_scores = {}
+                for doc, tf in postings.items():
+                    norm = tf + self.K1 * (1 - self.B + self.B * self._lengths[doc] / avg_len)
+                    term_scores[doc] = idf * tf * (self.K1 + 1) / norm
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {d: s + term_scores[d] for d, s in scores.items() if d in term_scores}
+                if not scores:
+                    return []
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        results = []
+        for doc, score in ranked:
+            kind, doc_id = doc.split(":")
+            results.append((kind, int(doc_id), round(score, 4)))
+        return results
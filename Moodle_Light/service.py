@@ -1,24 +1,763 @@
-import json, os, tempfile, threading
+import json, os, sqlite3, tempfile, threading, time
+from contextlib import contextmanager
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: file_lock only serializes threads of one process
+    fcntl = None
 
 _lock = threading.Lock()
 
+# Parsed JSON documents kept in memory: abspath -> (stamp, data).
+# The stamp is (inode, mtime_ns, size) of the file the data came from, so an
+# os.replace by another process (new inode) or an in-place edit is noticed.
+_cache = {}
+# Secondary indexes built over cached documents:
+# (abspath, collection, key, unique) -> (stamp, index)
+_indexes = {}
+
+def _stamp(st):
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _load(path, default):
+    start = time.perf_counter()
+    try:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            _cache.pop(path, None)
+            return None, default if default is not None else {}
+        hit = _cache.get(path)
+        if hit and hit[0] == _stamp(st):
+            return hit
+        parse_start = time.perf_counter()
+        with open(path, "r", encoding="utf-8") as f:
+            stamp = _stamp(os.fstat(f.fileno()))
+            data = json.load(f)
+        metrics.observe("parse", time.perf_counter() - parse_start, read=stamp[2])
+        _cache[path] = (stamp, data)
+        return stamp, data
+    finally:
+        metrics.observe("load", time.perf_counter() - start)
+
 def load_json(path, default=None):
-    if not os.path.exists(path):
-        return default if default is not None else {}
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    # The returned object is shared with other callers: mutate it only when
+    # the result is passed straight to save_json.
+    return _load(os.path.abspath(path), default)[1]
+
+def index_by(path, collection, key, unique=True):
+    """Map ``key`` (a field name or a tuple of names) to the rows of
+    ``collection`` in the document at ``path``; with ``unique=False`` every
+    key maps to a list of rows. The index is rebuilt only after the file
+    changes, so lookups between writes are O(1)."""
+    path = os.path.abspath(path)
+    stamp, data = _load(path, None)
+    ikey = (path, collection, key, unique)
+    hit = _indexes.get(ikey)
+    if stamp is not None and hit and hit[0] == stamp:
+        return hit[1]
+    if isinstance(key, str):
+        getter = lambda row: row.get(key)
+    else:
+        getter = lambda row: tuple(row.get(k) for k in key)
+    if unique:
+        index = {getter(row): row for row in data.get(collection, [])}
+    else:
+        index = {}
+        for row in data.get(collection, []):
+            index.setdefault(getter(row), []).append(row)
+    _indexes[ikey] = (stamp, index)
+    return index
+
+def invalidate(path=None):
+    if path is None:
+        _cache.clear()
+        _indexes.clear()
+    else:
+        path = os.path.abspath(path)
+        _cache.pop(path, None)
+        for ikey in [k for k in _indexes if k[0] == path]:
+            _indexes.pop(ikey, None)
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on ``path`` shared by threads and worker processes.
+
+    Held around a whole read-modify-write so that concurrent writers (e.g.
+    several gunicorn workers) neither lose updates nor hand out the same id."""
+    path = os.path.abspath(path)
+    with _path_locks_guard:
+        lock = _path_locks.setdefault(path, threading.Lock())
+    start = time.perf_counter()
+    with lock:
+        if fcntl is None:
+            metrics.observe("lock", time.perf_counter() - start)
+            yield
+            return
+        with open(path + ".lock", "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            metrics.observe("lock", time.perf_counter() - start)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
 
 def save_json(path, data):
+    path = os.path.abspath(path)
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    start = time.perf_counter()
     with _lock:
+        metrics.observe("lock", time.perf_counter() - start)
+        start = time.perf_counter()
         fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix="tmp.", suffix=".json")
+        written = False
         try:
             with os.fdopen(fd, "w", encoding="utf-8") as tmpf:
                 json.dump(data, tmpf, ensure_ascii=False, indent=2)
                 tmpf.flush()
                 os.fsync(tmpf.fileno())
+                stamp = _stamp(os.fstat(tmpf.fileno()))
             os.replace(tmp, path)
+            _cache[path] = (stamp, data)
+            written = True
         finally:
+            if not written:
+                # callers mutate the cached object before saving; if the write
+                # failed, the next load must go back to what is on disk
+                _cache.pop(path, None)
             if os.path.exists(tmp):
                 try: os.remove(tmp)
-                except OSError: pass
\ No newline at end of file
+                except OSError: pass
+            metrics.observe("save", time.perf_counter() - start, written=stamp[2] if written else 0)
+
+
+# ----------------- storage backends -----------------
+# Both backends expose the same row-level API over the five collections.
+# Rows they return are shared with the cache and must be treated as read-only:
+# every change goes through insert/upsert/update/delete.
+SCHEMA = {
+    "users": {
+        "key": ("id",),
+        "columns": {"id": "INTEGER", "username": "TEXT", "password": "TEXT", "role": "TEXT"},
+        "unique": ("username",),
+    },
+    "courses": {
+        "key": ("id",),
+        "columns": {"id": "INTEGER", "title": "TEXT", "description": "TEXT"},
+    },
+    "tasks": {
+        "key": ("id",),
+        "columns": {"id": "INTEGER", "course_id": "INTEGER", "title": "TEXT",
+                    "description": "TEXT", "deadline": "TEXT"},
+        "indexes": ("course_id",),
+    },
+    "comments": {
+        "key": ("id",),
+        "columns": {"id": "INTEGER", "course_id": "INTEGER", "user_id": "INTEGER", "text": "TEXT"},
+        "indexes": ("course_id",),
+    },
+    "submissions": {
+        "key": ("task_id", "user_id"),
+        "columns": {"task_id": "INTEGER", "user_id": "INTEGER", "filename": "TEXT",
+                    "grade": "INTEGER", "feedback": "TEXT", "graded_by": "INTEGER",
+                    "graded_at": "TEXT", "sha256": "TEXT", "size": "INTEGER"},
+        "indexes": ("user_id",),
+    },
+}
+
+def _auto_id(name):
+    return SCHEMA[name]["key"] == ("id",)
+
+def _row_key(name, row):
+    key = tuple(row.get(k) for k in SCHEMA[name]["key"])
+    return key[0] if len(key) == 1 else key
+
+# Collections whose changes are appended to ``<name>.journal`` (JSON lines)
+# instead of rewriting ``<name>.json``; the journal is folded back into the
+# snapshot every COMPACT_EVERY entries.
+JOURNALED = ("comments", "submissions")
+COMPACT_EVERY = 500
+
+def _json_key(key):
+    return list(key) if isinstance(key, tuple) else key
+
+def _key_from_json(key):
+    return tuple(key) if isinstance(key, list) else key
+
+class _Journal:
+    """A snapshot document plus the append-only log of row changes after it.
+
+    Entries are ``{"op": "put", "row": {...}}`` or ``{"op": "del", "key": k}``;
+    both are idempotent, so replaying a journal that was already folded into
+    the snapshot (a crash mid-compaction) gives the same rows."""
+
+    def __init__(self, name, snapshot, path):
+        self.name, self.snapshot, self.path = name, os.path.abspath(snapshot), path
+        self.rows = {}
+        self.version = 0
+        self.entries = 0
+        self.max_id = 0
+        self._source = None  # (snapshot stamp, journal inode) the rows come from
+        self._offset = 0     # journal bytes already applied
+        self._indexes = {}
+        self._all = (None, [])
+        # readers refresh without the file lock, so they can run alongside
+        # a writer's append or compaction in another thread
+        self._lock = threading.RLock()
+        self._appending = False  # journal tail belongs to an append in flight
+
+    def refresh(self):
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+                ino, size = st.st_ino, st.st_size
+            except FileNotFoundError:
+                ino, size = None, 0
+            stamp, data = _load(self.snapshot, None)
+            if self._source != (stamp, ino) or size < self._offset:
+                self.rows = {}
+                self.max_id = 0
+                self._indexes = {}
+                for row in data.get(self.name, []):
+                    self._put(row)
+                self._source, self._offset, self.entries = (stamp, ino), 0, 0
+                self.version += 1
+            if size > self._offset and not self._appending:
+                start = time.perf_counter()
+                with open(self.path, "rb") as f:
+                    f.seek(self._offset)
+                    chunk = f.read(size - self._offset)
+                metrics.observe("load", time.perf_counter() - start, read=len(chunk))
+                # an unterminated last line is an append still in flight (or torn
+                # by a crash); it is picked up, or cut off, by the next append
+                end = chunk.rfind(b"\n") + 1
+                for line in chunk[:end].splitlines():
+                    if line.strip():
+                        self._apply(json.loads(line))
+                        self.entries += 1
+                if end:
+                    self._offset += end
+                    self.version += 1
+
+    def _put(self, row):
+        key = _row_key(self.name, row)
+        self._drop(key)
+        self.rows[key] = row
+        for field, index in self._indexes.items():
+            index.setdefault(row.get(field), {})[key] = row
+        if isinstance(row.get("id"), int):
+            self.max_id = max(self.max_id, row["id"])
+
+    def _drop(self, key):
+        old = self.rows.pop(key, None)
+        if old is not None:
+            for field, index in self._indexes.items():
+                bucket = index.get(old.get(field))
+                if bucket:
+                    bucket.pop(key, None)
+
+    def _apply(self, entry):
+        if entry["op"] == "put":
+            self._put(entry["row"])
+        elif entry["op"] == "del":
+            self._drop(_key_from_json(entry["key"]))
+
+    def token(self):
+        with self._lock:
+            return (self._source, self._offset)
+
+    def all(self):
+        with self._lock:
+            if self._all[0] != self.version:
+                self._all = (self.version, list(self.rows.values()))
+            return self._all[1]
+
+    def find(self, field, value):
+        with self._lock:
+            index = self._indexes.get(field)
+            if index is None:
+                index = {}
+                for key, row in self.rows.items():
+                    index.setdefault(row.get(field), {})[key] = row
+                self._indexes[field] = index
+            return list(index.get(value, {}).values())
+
+    def append(self, entries):
+        # the caller holds the file lock; the write and fsync run outside
+        # self._lock so that readers are not held up, and they leave the
+        # tail alone until the entries are applied here
+        data = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries).encode("utf-8")
+        with self._lock:
+            self._appending = True
+            offset = self._offset
+        start = time.perf_counter()
+        try:
+            with open(self.path, "ab") as f:
+                if f.tell() > offset:
+                    f.truncate(offset)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                ino = os.fstat(f.fileno()).st_ino
+            metrics.observe("save", time.perf_counter() - start, written=len(data))
+        except BaseException:
+            with self._lock:
+                self._appending = False
+            raise
+        with self._lock:
+            self._appending = False
+            self._source = (self._source[0], ino)
+            for entry in entries:
+                self._apply(entry)
+            self._offset += len(data)
+            self.entries += len(entries)
+            self.version += 1
+
+    def compact(self):
+        with self._lock:
+            save_json(self.snapshot, {self.name: list(self.rows.values())})
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", prefix="tmp.", suffix=".journal")
+            os.close(fd)
+            os.replace(tmp, self.path)
+            self._source = (_cache[self.snapshot][0], os.stat(self.path).st_ino)
+            self._offset, self.entries = 0, 0
+
+class JsonStorage:
+    """Collections kept as ``<name>.json`` documents in ``data_dir``."""
+
+    def __init__(self, data_dir, compact_every=COMPACT_EVERY):
+        self.data_dir = data_dir
+        self.compact_every = compact_every
+        self._listeners = {}
+        self._journals = {
+            name: _Journal(name, self.path(name), os.path.join(data_dir, name + ".journal"))
+            for name in JOURNALED
+        }
+
+    def path(self, name):
+        return os.path.join(self.data_dir, name + ".json")
+
+    def _doc(self, name):
+        return load_json(self.path(name), {name: []})
+
+    def _key_field(self, name):
+        key = SCHEMA[name]["key"]
+        return key[0] if len(key) == 1 else key
+
+    def _journal(self, name):
+        journal = self._journals.get(name)
+        if journal is not None:
+            journal.refresh()
+        return journal
+
+    def _next_id(self, name, current_max):
+        # the last id handed out is kept in <name>.seq so ids of deleted rows
+        # are not reused; the caller holds the collection's file_lock
+        seq = os.path.join(self.data_dir, name + ".seq")
+        try:
+            with open(seq, encoding="utf-8") as f:
+                last = int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            last = 0
+        new_id = max(last, current_max) + 1
+        with open(seq, "w", encoding="utf-8") as f:
+            f.write(str(new_id))
+        return new_id
+
+    def _log(self, journal, entries):
+        journal.append(entries)
+        if journal.entries >= self.compact_every:
+            journal.compact()
+
+    def compact(self):
+        for name, journal in self._journals.items():
+            with file_lock(self.path(name)):
+                journal.refresh()
+                if journal.entries:
+                    journal.compact()
+
+    def all(self, name):
+        journal = self._journal(name)
+        if journal:
+            return journal.all()
+        return self._doc(name).get(name, [])
+
+    def iter_all(self, name):
+        return iter(self.all(name))
+
+    def get(self, name, key):
+        journal = self._journal(name)
+        if journal:
+            return journal.rows.get(key)
+        return index_by(self.path(name), name, self._key_field(name)).get(key)
+
+    def get_many(self, name, keys):
+        """``{key: row}`` for the keys that exist."""
+        journal = self._journal(name)
+        rows = journal.rows if journal else index_by(self.path(name), name, self._key_field(name))
+        return {key: rows[key] for key in keys if key in rows}
+
+    def find(self, name, field, value):
+        journal = self._journal(name)
+        if journal:
+            return journal.find(field, value)
+        return index_by(self.path(name), name, field, unique=False).get(value, [])
+
+    def version(self, name):
+        """Token that changes whenever the collection changes, in any process."""
+        journal = self._journal(name)
+        if journal:
+            return journal.token()
+        return _load(os.path.abspath(self.path(name)), None)[0]
+
+    def subscribe(self, name, callback):
+        """Call ``callback(changes, before, after)`` after every write made
+        through this object; ``changes`` lists ``(old, new)`` rows and
+        ``before``/``after`` are the versions read under the write lock."""
+        self._listeners.setdefault(name, []).append(callback)
+
+    @contextmanager
+    def _writing(self, name):
+        with file_lock(self.path(name)):
+            changes = []
+            before = self.version(name)
+            yield changes
+            if changes:
+                after = self.version(name)
+                for callback in self._listeners.get(name, ()):
+                    callback(changes, before, after)
+
+    def insert(self, name, row):
+        with self._writing(name) as changes:
+            journal = self._journal(name)
+            if journal:
+                if _auto_id(name) and row.get("id") is None:
+                    row = dict(row, id=self._next_id(name, journal.max_id))
+                self._log(journal, [{"op": "put", "row": row}])
+            else:
+                data = self._doc(name)
+                rows = data.setdefault(name, [])
+                if _auto_id(name) and row.get("id") is None:
+                    row = dict(row, id=self._next_id(name, max((r["id"] for r in rows), default=0)))
+                rows.append(row)
+                save_json(self.path(name), data)
+            changes.append((None, row))
+        return row
+
+    def upsert(self, name, row):
+        key = _row_key(name, row)
+        with self._writing(name) as changes:
+            old = self.get(name, key)
+            journal = self._journal(name)
+            if journal:
+                self._log(journal, [{"op": "put", "row": row}])
+            else:
+                data = self._doc(name)
+                data[name] = [r for r in data.get(name, []) if _row_key(name, r) != key]
+                data[name].append(row)
+                save_json(self.path(name), data)
+            changes.append((old, row))
+        return row
+
+    def update(self, name, key, changes):
+        return self.update_many(name, [(key, changes)])[0]
+
+    def update_many(self, name, updates):
+        """Apply ``[(key, changes), ...]`` with a single write (one journal
+        append or one file rewrite). Returns the updated rows, with None
+        where the key does not exist."""
+        with self._writing(name) as written:
+            journal = self._journal(name)
+            data = None if journal else self._doc(name)
+            current, result = {}, []
+            for key, changes in updates:
+                old = current[key] if key in current else self.get(name, key)
+                if old is None:
+                    result.append(None)
+                    continue
+                if journal:
+                    row = dict(old, **changes)
+                else:
+                    row, old = old, dict(old)
+                    row.update(changes)
+                current[key] = row
+                written.append((old, row))
+                result.append(row)
+            if written:
+                if journal:
+                    self._log(journal, [{"op": "put", "row": row} for row in current.values()])
+                else:
+                    save_json(self.path(name), data)
+        return result
+
+    def delete(self, name, key):
+        return self._remove(name, lambda r: _row_key(name, r) == key,
+                            lambda journal: [key] if key in journal.rows else [])
+
+    def delete_where(self, name, field, value):
+        return self._remove(name, lambda r: r.get(field) == value,
+                            lambda journal: [_row_key(name, r) for r in journal.find(field, value)])
+
+    def _remove(self, name, match, journal_keys):
+        with self._writing(name) as changes:
+            journal = self._journal(name)
+            if journal:
+                keys = journal_keys(journal)
+                old = [journal.rows[k] for k in keys]
+                if keys:
+                    self._log(journal, [{"op": "del", "key": _json_key(k)} for k in keys])
+            else:
+                data = self._doc(name)
+                old = [r for r in data.get(name, []) if match(r)]
+                if old:
+                    data[name] = [r for r in data.get(name, []) if not match(r)]
+                    save_json(self.path(name), data)
+            changes.extend((row, None) for row in old)
+        return len(old)
+
+class _TimedConnection(sqlite3.Connection):
+    """Connection that reports the time of every statement as "sql" work."""
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            metrics.observe("sql", time.perf_counter() - start)
+
+    def executemany(self, sql, seq):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            metrics.observe("sql", time.perf_counter() - start)
+
+class SqliteStorage:
+    """Collections kept as indexed tables in one SQLite database (WAL mode).
+
+    Columns listed in SCHEMA are real table columns; any other row fields are
+    kept as a JSON object in the ``extra`` column."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._listeners = {}
+        self._init_schema()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                               check_same_thread=False, factory=_TimedConnection)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _init_schema(self):
+        with self._tx() as conn:
+            for name, spec in SCHEMA.items():
+                cols = []
+                for col, ctype in spec["columns"].items():
+                    if _auto_id(name) and col == "id":
+                        cols.append("id INTEGER PRIMARY KEY AUTOINCREMENT")
+                    else:
+                        cols.append(f"{col} {ctype}")
+                cols.append("extra TEXT")
+                if not _auto_id(name):
+                    cols.append("PRIMARY KEY (%s)" % ", ".join(spec["key"]))
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({', '.join(cols)})")
+                existing = {r[1] for r in conn.execute(f"PRAGMA table_info({name})")}
+                for col, ctype in spec["columns"].items():
+                    if col not in existing:
+                        conn.execute(f"ALTER TABLE {name} ADD COLUMN {col} {ctype}")
+                for col in spec.get("unique", ()):
+                    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_{col} ON {name} ({col})")
+                for col in spec.get("indexes", ()):
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_{col} ON {name} ({col})")
+            # per-collection change counters, bumped by triggers on every write
+            conn.execute("CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, v INTEGER NOT NULL)")
+            for name in SCHEMA:
+                conn.execute("INSERT OR IGNORE INTO versions (name, v) VALUES (?, 0)", (name,))
+                for event in ("INSERT", "UPDATE", "DELETE"):
+                    conn.execute(
+                        f"CREATE TRIGGER IF NOT EXISTS {name}_{event.lower()}_version AFTER {event} ON {name} "
+                        f"BEGIN UPDATE versions SET v = v + 1 WHERE name = '{name}'; END"
+                    )
+
+    def _select(self, name, where="", params=()):
+        cols = list(SCHEMA[name]["columns"]) + ["extra"]
+        order = ", ".join(SCHEMA[name]["key"])
+        sql = f"SELECT {', '.join(cols)} FROM {name} {where} ORDER BY {order}"
+        return [self._row(cols, values) for values in self._conn().execute(sql, params)]
+
+    def _row(self, cols, values):
+        row = {c: v for c, v in zip(cols, values) if v is not None and c != "extra"}
+        if values[-1]:
+            row.update(json.loads(values[-1]))
+        return row
+
+    def _key_where(self, name, key):
+        fields = SCHEMA[name]["key"]
+        key = key if isinstance(key, tuple) else (key,)
+        return "WHERE " + " AND ".join(f"{f} = ?" for f in fields), key
+
+    def _write(self, conn, verb, name, row):
+        columns = SCHEMA[name]["columns"]
+        cols = [c for c in columns if c in row]
+        extra = {k: v for k, v in row.items() if k not in columns}
+        values = [row[c] for c in cols]
+        cols.append("extra")
+        values.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+        marks = ", ".join("?" * len(cols))
+        return conn.execute(f"{verb} INTO {name} ({', '.join(cols)}) VALUES ({marks})", values)
+
+    def all(self, name):
+        return self._select(name)
+
+    def iter_all(self, name):
+        """Rows one at a time from a cursor, for exports that must not hold
+        the whole table in memory.
+
+        The cursor gets a connection of its own: a streamed response is
+        resumed on whichever thread is free, and the thread's connection may
+        be in the middle of another request's transaction by then."""
+        cols = list(SCHEMA[name]["columns"]) + ["extra"]
+        order = ", ".join(SCHEMA[name]["key"])
+        conn = self._connect()
+        try:
+            for values in conn.execute(f"SELECT {', '.join(cols)} FROM {name} ORDER BY {order}"):
+                yield self._row(cols, values)
+        finally:
+            conn.close()
+
+    def get(self, name, key):
+        rows = self._select(name, *self._key_where(name, key))
+        return rows[0] if rows else None
+
+    def get_many(self, name, keys):
+        """``{key: row}`` for the keys that exist (single-column keys only)."""
+        (field,) = SCHEMA[name]["key"]
+        keys, found = list(keys), {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ", ".join("?" * len(chunk))
+            for row in self._select(name, f"WHERE {field} IN ({marks})", chunk):
+                found[row[field]] = row
+        return found
+
+    def find(self, name, field, value):
+        if field not in SCHEMA[name]["columns"]:
+            raise KeyError(field)
+        return self._select(name, f"WHERE {field} = ?", (value,))
+
+    def version(self, name):
+        return self._conn().execute("SELECT v FROM versions WHERE name = ?", (name,)).fetchone()[0]
+
+    def subscribe(self, name, callback):
+        """Same contract as JsonStorage.subscribe."""
+        self._listeners.setdefault(name, []).append(callback)
+
+    @contextmanager
+    def _writing(self, name):
+        changes = []
+        with self._tx() as conn:
+            before = self.version(name)
+            yield conn, changes
+            after = self.version(name)
+        if changes:
+            for callback in self._listeners.get(name, ()):
+                callback(changes, before, after)
+
+    def insert(self, name, row):
+        with self._writing(name) as (conn, changes):
+            cur = self._write(conn, "INSERT", name, row)
+            if _auto_id(name) and row.get("id") is None:
+                row = dict(row, id=cur.lastrowid)
+            changes.append((None, row))
+        return row
+
+    def upsert(self, name, row):
+        with self._writing(name) as (conn, changes):
+            old = self.get(name, _row_key(name, row))
+            self._write(conn, "INSERT OR REPLACE", name, row)
+            changes.append((old, row))
+        return row
+
+    def update(self, name, key, changes):
+        return self.update_many(name, [(key, changes)])[0]
+
+    def update_many(self, name, updates):
+        """Same contract as JsonStorage.update_many; one transaction."""
+        columns = SCHEMA[name]["columns"]
+        result = []
+        with self._writing(name) as (conn, written):
+            for key, changes in updates:
+                old = self.get(name, key)
+                if old is None:
+                    result.append(None)
+                    continue
+                row = dict(old, **changes)
+                extra = {k: v for k, v in row.items() if k not in columns}
+                sets = [c for c in changes if c in columns]
+                values = [row[c] for c in sets] + [json.dumps(extra, ensure_ascii=False) if extra else None]
+                assignments = ", ".join(f"{c} = ?" for c in sets + ["extra"])
+                where, params = self._key_where(name, key)
+                conn.execute(f"UPDATE {name} SET {assignments} {where}", values + list(params))
+                written.append((old, row))
+                result.append(row)
+        return result
+
+    def delete(self, name, key):
+        return self._remove(name, *self._key_where(name, key))
+
+    def delete_where(self, name, field, value):
+        if field not in SCHEMA[name]["columns"]:
+            raise KeyError(field)
+        return self._remove(name, f"WHERE {field} = ?", (value,))
+
+    def _remove(self, name, where, params):
+        with self._writing(name) as (conn, changes):
+            old = self._select(name, where, params)
+            if old:
+                conn.execute(f"DELETE FROM {name} {where}", params)
+            changes.extend((row, None) for row in old)
+        return len(old)
+
+def migrate_json_to_sqlite(data_dir, db_path):
+    """Copy every JSON collection into the SQLite database; safe to re-run."""
+    src, dst = JsonStorage(data_dir), SqliteStorage(db_path)
+    counts = {}
+    with dst._tx() as conn:
+        for name in SCHEMA:
+            rows = src.all(name)
+            for row in rows:
+                dst._write(conn, "INSERT OR REPLACE", name, row)
+            counts[name] = len(rows)
+    return counts
+
+def open_storage(kind, data_dir, db_path=None):
+    if kind == "json":
+        return JsonStorage(data_dir)
+    if kind == "sqlite":
+        return SqliteStorage(db_path or os.path.join(data_dir, "moodle.db"))
+    raise ValueError(f"unknown storage backend: {kind}")
@@ -0,0 +1,216 @@
+import os, re, secrets, tempfile, threading, time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+_SID = re.compile(r"^[A-Za-z0-9_-]{43}$")  # secrets.token_urlsafe(32)
+_serializer = TaggedJSONSerializer()  # what Flask's cookie sessions use: keeps tuples, bytes, dates
+
+class MemorySessionStore:
+    """Sessions of this process only: lost on restart, not shared by workers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}  # sid -> (expires, serialized data)
+        self._writes = 0
+
+    def load(self, sid):
+        entry = self._data.get(sid)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry[1]
+
+    def save(self, sid, text, expires):
+        with self._lock:
+            self._data[sid] = (expires, text)
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                now = time.time()
+                for key in [k for k, (exp, _) in self._data.items() if exp < now]:
+                    del self._data[key]
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+class FileSessionStore:
+    """One ``<sid>`` file per session in ``path``: shared by worker processes
+    and kept over restarts. Parsed files are cached by their mtime/size, so
+    an unchanged session costs one stat per request."""
+
+    def __init__(self, path, cache_size=10000):
+        self.path = path
+        self.cache_size = cache_size
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # sid -> (stamp, expires, text)
+        self._writes = 0
+
+    def _file(self, sid):
+        return os.path.join(self.path, sid)
+
+    def load(self, sid):
+        try:
+            st = os.stat(self._file(sid))
+        except FileNotFoundError:
+            return None
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            hit = self._cache.get(sid)
+        if hit is None or hit[0] != stamp:
+            try:
+                with open(self._file(sid), encoding="utf-8") as f:
+                    expires, text = f.read().split("\n", 1)
+                    hit = (stamp, float(expires), text)
+            except (FileNotFoundError, ValueError):
+                return None
+            with self._lock:
+                self._cache[sid] = hit
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if hit[1] < time.time():
+            self.delete(sid)
+            return None
+        return hit[2]
+
+    def save(self, sid, text, expires):
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix="tmp.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(f"{expires}\n{text}")
+            os.replace(tmp, self._file(sid))
+        finally:
+            if os.path.exists(tmp):
+                try: os.remove(tmp)
+                except OSError: pass
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % 1000 == 0
+        if sweep:
+            self.sweep()
+
+    def delete(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+        try:
+            os.remove(self._file(sid))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        """Remove expired session files."""
+        now = time.time()
+        for name in os.listdir(self.path):
+            if not _SID.match(name):
+                continue
+            try:
+                with open(self._file(name), encoding="utf-8") as f:
+                    expired = float(f.readline() or 0) < now
+            except (OSError, ValueError):
+                continue
+            if expired:
+                self.delete(name)
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.uid = (initial or {}).get("uid")  # who the session belonged to when opened
+        self.modified = False
+
+class ServerSessionInterface(SessionInterface):
+    """Flask sessions kept in ``store``; the cookie only carries a random id.
+
+    A new id is issued whenever the logged-in user changes (login, logout),
+    so an id seen before login is useless afterwards."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and _SID.match(sid):
+            text = self.store.load(sid)
+            if text is not None:
+                try:
+                    return ServerSession(_serializer.loads(text), sid)
+                except ValueError:
+                    pass
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain, path = self.get_cookie_domain(app), self.get_cookie_path(app)
+        if not session:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if session.get("uid") != session.uid and session.sid is not None:
+            self.store.delete(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        elif not self.should_set_cookie(app, session):
+            return
+        expires = self.get_expiration_time(app, session)
+        lifetime = time.time() + app.permanent_session_lifetime.total_seconds()
+        self.store.save(session.sid, _serializer.dumps(dict(session)),
+                        expires.timestamp() if expires else lifetime)
+        response.vary.add("Cookie")
+        response.set_cookie(name, session.sid, expires=expires, httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path, secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+
+class SessionUsers:
+    """The user record of each logged-in session, read from storage once.
+
+    Entries are dropped when the user is written through ``db``; writes by
+    other processes are noticed through the users version, checked at most
+    every ``recheck`` seconds."""
+
+    def __init__(self, db, maxsize=10000, recheck=1.0):
+        self.db = db
+        self.maxsize = maxsize
+        self.recheck = recheck
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # sid -> user
+        self._version = None
+        self._checked = 0.0
+        db.subscribe("users", self._on_change)
+
+    def _on_change(self, changes, before, after):
+        uids = {row["id"] for pair in changes for row in pair if row is not None}
+        with self._lock:
+            for sid in [s for s, user in self._entries.items() if user["id"] in uids]:
+                del self._entries[sid]
+
+    def get(self, session):
+        uid = session.get("uid")
+        if not uid:
+            return None
+        now = time.monotonic()
+        if now - self._checked > self.recheck:
+            version = self.db.version("users")
+            with self._lock:
+                if version != self._version:
+                    self._entries.clear()
+                    self._version = version
+                self._checked = now
+        key = getattr(session, "sid", None)  # None with Flask's cookie sessions
+        with self._lock:
+            user = self._entries.get(key)
+            if user is not None and user["id"] == uid:
+                self._entries.move_to_end(key)
+                return user
+        user = self.db.get("users", uid)
+        if user is not None and key is not None:
+            with self._lock:
+                self._entries[key] = user
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return user
@@ -1,21 +1,34 @@
+// /api/courses отдаёт список страницами: следующая — по курсору из X-Next-Cursor.
+// Ответы кэшируются браузером по ETag, поэтому неизменившиеся страницы приходят как 304.
+async function fetchCourses() {
+  const courses = [];
+  let cursor = "";
+  do {
+    const url = "/api/courses?fields=id,title&limit=500" + (cursor ? "&cursor=" + encodeURIComponent(cursor) : "");
+    const res = await fetch(url, { cache: "no-cache" });
+    if (!res.ok) throw new Error(res.status);
+    courses.push(...await res.json());
+    cursor = res.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return courses;
+}
+
 async function renderCourses() {
   const ul = document.querySelector("ul");
-  const res = await fetch("/api/courses"); // GET
-  if (!res.ok) { ul.innerHTML = <li>Ошибка ${res.status}</li>; return; }
-  const courses = await res.json();
+  let courses;
+  try { courses = await fetchCourses(); } catch (e) { ul.innerHTML = `<li>Ошибка ${e.message}</li>`; return; }
   if (!courses.length) { ul.innerHTML = "<li>Курсов пока нет</li>"; return; }
-  ul.innerHTML = courses.map(c => <li>${c.title}</li>).join("");
+  ul.innerHTML = courses.map(c => `<li>${c.title}</li>`).join("");
 }
 renderCourses();
 
 async function loadCourses() {
   const ul = document.getElementById("courses");
   ul.innerHTML = "<li>Загрузка…</li>";
-  const res = await fetch("/api/courses");
-  if (!res.ok) { ul.innerHTML = <li>Ошибка ${res.status}</li>; return; }
-  const courses = await res.json();
+  let courses;
+  try { courses = await fetchCourses(); } catch (e) { ul.innerHTML = `<li>Ошибка ${e.message}</li>`; return; }
   if (!courses.length) { ul.innerHTML = "<li>Курсов пока нет</li>"; return; }
-  ul.innerHTML = courses.map(c => <li>[${c.id}] ${c.title}</li>).join("");
+  ul.innerHTML = courses.map(c => `<li>[${c.id}] ${c.title}</li>`).join("");
 }
 
 document.getElementById("addCourse").addEventListener("submit", async (e) => {
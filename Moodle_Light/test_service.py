@@ -0,0 +1,122 @@
+"""Tests of the storage backends; run ``python -m pytest -q`` in Moodle_Light."""
+import json, multiprocessing, os, threading
+
+import pytest
+
+from service import JsonStorage, SqliteStorage
+
+def _comment(i):
+    return {"course_id": 1, "user_id": 1, "text": f"comment {i}"}
+
+def _texts(storage):
+    return sorted(r["text"] for r in storage.all("comments"))
+
+@pytest.fixture
+def data_dir(tmp_path):
+    return str(tmp_path)
+
+def test_journal_replays_in_a_new_process(data_dir):
+    storage = JsonStorage(data_dir)
+    rows = [storage.insert("comments", _comment(i)) for i in range(5)]
+    storage.update("comments", rows[1]["id"], {"text": "edited"})
+    storage.delete("comments", rows[2]["id"])
+
+    fresh = JsonStorage(data_dir)
+    assert _texts(fresh) == ["comment 0", "comment 3", "comment 4", "edited"]
+    assert fresh.get("comments", rows[1]["id"])["text"] == "edited"
+    assert fresh.get("comments", rows[2]["id"]) is None
+    assert not os.path.exists(os.path.join(data_dir, "comments.json"))
+
+def test_torn_tail_is_ignored_and_cut_off_by_the_next_append(data_dir):
+    storage = JsonStorage(data_dir)
+    storage.insert("comments", _comment(0))
+    journal = os.path.join(data_dir, "comments.journal")
+    with open(journal, "ab") as f:
+        f.write(b'{"op": "put", "row": {"id": 99, "te')  # crash mid-append
+
+    fresh = JsonStorage(data_dir)
+    assert _texts(fresh) == ["comment 0"]
+    fresh.insert("comments", _comment(1))
+    with open(journal, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert [e["row"]["text"] for e in entries] == ["comment 0", "comment 1"]
+    assert _texts(JsonStorage(data_dir)) == ["comment 0", "comment 1"]
+
+def test_compaction_folds_the_journal_into_the_snapshot(data_dir):
+    storage = JsonStorage(data_dir, compact_every=3)
+    for i in range(5):
+        storage.insert("comments", _comment(i))
+    with open(os.path.join(data_dir, "comments.json"), encoding="utf-8") as f:
+        assert len(json.load(f)["comments"]) == 3
+    assert _texts(JsonStorage(data_dir)) == [f"comment {i}" for i in range(5)]
+
+    storage.compact()
+    assert os.path.getsize(os.path.join(data_dir, "comments.journal")) == 0
+    assert _texts(JsonStorage(data_dir)) == [f"comment {i}" for i in range(5)]
+
+def test_deleted_ids_are_not_handed_out_again(data_dir):
+    storage = JsonStorage(data_dir)
+    row = storage.insert("comments", _comment(0))
+    storage.delete("comments", row["id"])
+    assert storage.insert("comments", _comment(1))["id"] == row["id"] + 1
+
+def _insert_many(data_dir, worker, count):
+    storage = JsonStorage(data_dir)
+    for i in range(count):
+        storage.insert("comments", _comment(f"{worker}-{i}"))
+
+def test_processes_get_distinct_ids(data_dir):
+    workers, count = 6, 200
+    processes = [multiprocessing.Process(target=_insert_many, args=(data_dir, w, count))
+                 for w in range(workers)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+
+    rows = JsonStorage(data_dir).all("comments")
+    assert len(rows) == workers * count
+    assert sorted(r["id"] for r in rows) == list(range(1, workers * count + 1))
+    with open(os.path.join(data_dir, "comments.seq"), encoding="utf-8") as f:
+        assert int(f.read()) == workers * count
+
+def test_readers_in_other_threads_see_whole_appends(data_dir):
+    storage = JsonStorage(data_dir, compact_every=50)
+    done, errors = threading.Event(), []
+
+    def read():
+        while not done.is_set():
+            try:
+                texts = [r["text"] for r in storage.all("comments")]
+                storage.find("comments", "course_id", 1)
+                storage.version("comments")
+                assert len(texts) == len(set(texts))
+            except Exception as e:  # reported by the assert below
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for t in readers:
+        t.start()
+    try:
+        for i in range(300):
+            storage.insert("comments", _comment(i))
+    finally:
+        done.set()
+        for t in readers:
+            t.join()
+    assert errors == []
+    assert len(JsonStorage(data_dir).all("comments")) == 300
+
+def test_sqlite_iter_all_reads_outside_the_threads_transaction(data_dir):
+    storage = SqliteStorage(os.path.join(data_dir, "moodle.db"))
+    for name in ("ann", "bob"):
+        storage.insert("users", {"username": name, "password": "x", "role": "student"})
+    rows = storage.iter_all("users")
+    assert next(rows)["username"] == "ann"
+    # a streamed export resumed on a thread whose connection is mid-write
+    with storage._tx() as conn:
+        conn.execute("INSERT INTO users (username, password, role) VALUES ('eve', 'x', 'student')")
+        assert [r["username"] for r in rows] == ["bob"]
+        assert [r["username"] for r in storage.iter_all("users")] == ["ann", "bob"]
@@ -0,0 +1,100 @@
+import hashlib, os, tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+CHUNK_SIZE = 64 * 1024
+
+class HashingFile:
+    """Temporary upload file that hashes and counts bytes as they are written.
+
+    The multipart parser writes each chunk straight here, so an upload is
+    never held in memory and its SHA-256 is known as soon as parsing ends."""
+
+    def __init__(self, tmp_dir, max_size=None):
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=tmp_dir, prefix="upload.", suffix=".part")
+        self._f = os.fdopen(fd, "w+b")
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.max_size = max_size
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise RequestEntityTooLarge()
+        self.sha256.update(data)
+        return self._f.write(data)
+
+    def read(self, size=-1):
+        return self._f.read(size)
+
+    def readline(self, size=-1):
+        return self._f.readline(size)
+
+    def seek(self, offset, whence=0):
+        return self._f.seek(offset, whence)
+
+    def tell(self):
+        return self._f.tell()
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        # a file that was not moved into blob storage is dropped
+        self._f.close()
+        if self.path and os.path.exists(self.path):
+            try: os.remove(self.path)
+            except OSError: pass
+
+    def commit(self, dest):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(self.path, dest)
+        self.path = None
+
+class UploadRequest(Request):
+    """Request that spools uploaded files into HashingFile objects."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        f = HashingFile(tmp_dir(), current_app.config.get("MAX_UPLOAD_SIZE"))
+        self.__dict__.setdefault("_upload_files", []).append(f)
+        return f
+
+    def close(self):
+        # also covers files of a body whose parsing failed half-way (too large,
+        # client gone): those never reach request.files
+        super().close()
+        for f in self.__dict__.get("_upload_files", ()):
+            f.close()
+
+def tmp_dir():
+    return os.path.join(current_app.config["UPLOADS"], "tmp")
+
+def blob_path(uploads, sha256):
+    return os.path.join(uploads, "blobs", sha256[:2], sha256)
+
+def store(file):
+    """Move an uploaded FileStorage into content-addressed blob storage.
+
+    Returns ``(sha256, size)``. Identical content is stored once: a duplicate
+    upload only drops its temporary file."""
+    stream = file.stream
+    if not isinstance(stream, HashingFile):
+        stream = HashingFile(tmp_dir(), current_app.config.get("MAX_UPLOAD_SIZE"))
+        try:
+            for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b""):
+                stream.write(chunk)
+        except BaseException:
+            stream.close()
+            raise
+    digest = stream.sha256.hexdigest()
+    dest = blob_path(current_app.config["UPLOADS"], digest)
+    if os.path.exists(dest):
+        stream.close()
+    else:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        stream.commit(dest)
+    return digest, stream.size
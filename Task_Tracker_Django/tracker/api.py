@@ -0,0 +1,328 @@
+"""JSON API for projects and tasks, under /api/.
+
+    GET    /api/projects/        own projects          POST   create one
+    GET    /api/projects/<id>/   one project           PATCH  change, DELETE
+    GET    /api/tasks/           tasks, filtered as the task list (?q=, ?status=, ?project=)
+    POST   /api/tasks/           create one
+    GET    /api/tasks/<id>/      one task              PATCH  change, DELETE
+
+Lists are cursor-paginated (?limit=, then the "next"/"previous" links) and
+add "count" with ?count=1; ?fields=id,title picks fields. Writes go
+through the same forms as the HTML pages.
+
+Every GET carries an ETag computed from the representation itself, and
+single objects also Last-Modified from updated_at (not tasks with an
+assignee, whose username can change without touching the task). A client
+repeating a request with If-None-Match or If-Modified-Since gets an empty
+304 while nothing changed. PATCH and
+DELETE honour If-Match (412 if the object changed since it was read).
+
+Requests are authenticated by the session cookie (writes then need the
+CSRF token) or, for scripts, by HTTP Basic credentials; use HTTPS.
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+from django.contrib.auth import authenticate
+from django.core.exceptions import ValidationError
+from django.forms.models import model_to_dict
+from django.http import Http404, HttpResponse, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from . import caching
+from .forms import ProjectForm, TaskForm
+from .models import Project, Task
+from .pagination import InvalidCursor, KeysetPaginator
+from .views import TASK_FILTERS, filter_tasks, user_tasks
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def project_data(project):
+    return {
+        "id": project.pk,
+        "name": project.name,
+        "description": project.description,
+        "created_at": project.created_at,
+        "updated_at": project.updated_at,
+    }
+
+
+def task_data(task):
+    return {
+        "id": task.pk,
+        "project": task.project_id,
+        "title": task.title,
+        "description": task.description,
+        "assignee": task.assignee.get_username() if task.assignee_id else None,
+        "status": task.status,
+        "priority": task.priority,
+        "due_date": task.due_date,
+        "created_at": task.created_at,
+        "updated_at": task.updated_at,
+    }
+
+
+def _error(status, errors, **headers):
+    response = JsonResponse({"errors": errors}, status=status)
+    for name, value in headers.items():
+        response[name.replace("_", "-")] = value
+    return response
+
+
+def _etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def _basic_user(request):
+    try:
+        credentials = base64.b64decode(request.headers["Authorization"][6:], validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    username, _, password = credentials.partition(":")
+    return authenticate(request, username=username, password=password)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ApiView(View):
+    """Authentication, CSRF for cookie sessions, JSON errors, field selection
+    and conditional responses for the resources below."""
+    model = None
+    fields = ()  # what ?fields= may pick, in output order
+    serialize = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.headers.get("Authorization", "").startswith("Basic "):
+            user = _basic_user(request)
+            if user is None:
+                return _error(401, {"__all__": ["Invalid credentials."]}, WWW_Authenticate='Basic realm="tracker"')
+            request.user = user
+        elif not request.user.is_authenticated:
+            return _error(401, {"__all__": ["Authentication required."]}, WWW_Authenticate='Basic realm="tracker"')
+        elif request.method not in ("GET", "HEAD", "OPTIONS"):
+            csrf = CsrfViewMiddleware(lambda request: None)
+            csrf.process_request(request)
+            if csrf.process_view(request, None, (), {}) is not None:
+                return _error(403, {"__all__": ["CSRF check failed."]})
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ValidationError as e:
+            return _error(400, e.message_dict if hasattr(e, "error_dict") else {"__all__": e.messages})
+        except Http404:
+            return _error(404, {"__all__": ["Not found."]})
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        response = super().http_method_not_allowed(request, *args, **kwargs)
+        return _error(405, {"__all__": [f"{request.method} not allowed."]}, Allow=response["Allow"])
+
+    def selected_fields(self):
+        fields = self.request.GET.get("fields")
+        if not fields:
+            return self.fields
+        chosen = fields.split(",")
+        unknown = set(chosen) - set(self.fields)
+        if unknown:
+            raise ValidationError({"fields": [f"Unknown fields: {', '.join(sorted(unknown))}."]})
+        return tuple(f for f in self.fields if f in chosen)
+
+    def render(self, obj, fields):
+        data = self.serialize(obj)
+        return {name: data[name] for name in fields}
+
+    def last_modified(self, obj):
+        """When ``obj``'s representation last changed, if updated_at tells."""
+        return obj.updated_at
+
+    def conditional(self, body, etag, last_modified=None, status=200, check=True):
+        """``body`` as JSON with its validators, or 304/412 as the request's
+        preconditions ask (with ``check``; a write has checked them already)."""
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+        response = None
+        if check:
+            response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = JsonResponse(body, status=status)
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def json_body(self):
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            raise ValidationError({"__all__": ["Malformed JSON body."]})
+        if not isinstance(data, dict):
+            raise ValidationError({"__all__": ["Expected a JSON object."]})
+        return data
+
+    def form_errors(self, form):
+        return _error(400, {name: list(messages) for name, messages in form.errors.items()})
+
+
+class ListApiView(ApiView):
+    ordering = None
+
+    def count(self, queryset):
+        return queryset.count()
+
+    def get(self, request):
+        fields = self.selected_fields()
+        try:
+            limit = min(int(request.GET.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValidationError({"limit": [f"Expected 1 to {MAX_LIMIT}."]})
+        try:
+            queryset = self.get_queryset()
+            ordering = self.ordering or queryset.query.order_by or self.model._meta.ordering
+            page = KeysetPaginator(queryset, ordering, limit).page(request.GET.get("after"), request.GET.get("before"))
+        except InvalidCursor:
+            raise ValidationError({"cursor": ["Invalid cursor."]})
+        except (ValueError, ValidationError) as e:  # a filter value of the wrong type
+            raise ValidationError({"__all__": e.messages if isinstance(e, ValidationError) else [str(e)]})
+        body = {"results": [self.render(obj, fields) for obj in page]}
+        body["next"] = self.link(after=page.next_cursor) if page.has_next() else None
+        body["previous"] = self.link(before=page.previous_cursor) if page.has_previous() else None
+        if request.GET.get("count"):
+            body["count"] = self.count(queryset)
+        # a list has no single updated_at (and deleting a row makes it older),
+        # so it is validated by its ETag only
+        return self.conditional(body, _etag(body))
+
+    def link(self, **cursor):
+        query = self.request.GET.copy()
+        for name in ("after", "before"):
+            query.pop(name, None)
+        query.update(cursor)
+        return f"{self.request.path}?{query.urlencode()}"
+
+    def post(self, request):
+        form = self.get_form(self.json_body(), None)
+        if not form.is_valid():
+            return self.form_errors(form)
+        obj = self.save(form)
+        body = self.render(obj, self.fields)
+        response = self.conditional(body, _etag(body), self.last_modified(obj), status=201, check=False)
+        response["Location"] = f"{request.path}{obj.pk}/"
+        return response
+
+
+class DetailApiView(ApiView):
+    def get_object(self, pk):
+        return get_object_or_404(self.get_queryset(), pk=pk)
+
+    def respond(self, obj, fields, check=True):
+        body = self.render(obj, fields)
+        return self.conditional(body, _etag(body), self.last_modified(obj), check=check)
+
+    def get(self, request, pk):
+        fields = self.selected_fields()
+        return self.respond(self.get_object(pk), fields)
+
+    def precondition(self, obj):
+        # If-Match is compared with the full representation's ETag
+        last_modified = self.last_modified(obj)
+        return get_conditional_response(self.request, etag=_etag(self.render(obj, self.fields)),
+                                        last_modified=last_modified and int(last_modified.timestamp()))
+
+    def patch(self, request, pk):
+        obj = self.get_object(pk)
+        failed = self.precondition(obj)
+        if failed is not None:
+            return failed
+        data = self.initial(obj)
+        data.update(self.json_body())
+        form = self.get_form(data, obj)
+        if not form.is_valid():
+            return self.form_errors(form)
+        obj = self.save(form)
+        return self.respond(obj, self.fields, check=False)
+
+    def delete(self, request, pk):
+        obj = self.get_object(pk)
+        failed = self.precondition(obj)
+        if failed is not None:
+            return failed
+        obj.delete()
+        return HttpResponse(status=204)
+
+
+class ProjectResource:
+    model = Project
+    fields = ("id", "name", "description", "created_at", "updated_at")
+    serialize = staticmethod(project_data)
+    ordering = ["name", "id"]
+
+    def get_queryset(self):
+        return Project.objects.filter(owner=self.request.user)
+
+    def get_form(self, data, instance):
+        return ProjectForm(data, instance=instance)
+
+    def initial(self, project):
+        return model_to_dict(project, ProjectForm._meta.fields)
+
+    def save(self, form):
+        project = form.save(commit=False)
+        if project.owner_id is None:
+            project.owner = self.request.user
+        project.save()
+        return project
+
+
+class TaskResource:
+    model = Task
+    fields = ("id", "project", "title", "description", "assignee", "status", "priority", "due_date",
+              "created_at", "updated_at")
+    serialize = staticmethod(task_data)
+
+    def get_queryset(self):
+        projects = caching.user_projects(self.request.user)
+        return user_tasks(self.request.user, projects).select_related("assignee")
+
+    def get_form(self, data, instance):
+        return TaskForm(data, instance=instance, user=self.request.user)
+
+    def last_modified(self, task):
+        return None if task.assignee_id else task.updated_at
+
+    def initial(self, task):
+        data = model_to_dict(task, TaskForm._meta.fields)
+        data["assignee"] = task.assignee.get_username() if task.assignee_id else ""
+        return data
+
+    def save(self, form):
+        return form.save()
+
+
+class ProjectListApi(ProjectResource, ListApiView):
+    pass
+
+
+class ProjectDetailApi(ProjectResource, DetailApiView):
+    pass
+
+
+class TaskListApi(TaskResource, ListApiView):
+    def get_queryset(self):
+        return filter_tasks(super().get_queryset(), self.request.GET)
+
+    def count(self, queryset):
+        params = [self.request.GET.get(k, "") for k in TASK_FILTERS]
+        return caching.task_count(self.request.user, params, queryset.count)
+
+
+class TaskDetailApi(TaskResource, DetailApiView):
+    pass
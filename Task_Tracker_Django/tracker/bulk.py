@@ -0,0 +1,192 @@
+"""Changing many tasks at once: the actions behind /tasks/bulk/ and the
+CSV/JSON import behind /tasks/import/.
+
+Every row is validated before anything is written. If one fails, nothing
+is, and the per-row results say why; otherwise all rows are written in a
+single transaction with a handful of statements (update(), bulk_create(),
+bulk_update()) however many there are.
+"""
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching
+from .models import Project, Task
+
+User = get_user_model()
+
+ACTIONS = ("status", "priority", "assign", "delete")
+IMPORT_FIELDS = ("project", "title", "description", "assignee", "status", "priority", "due_date")  # as TaskForm
+MAX_ROWS = 10000
+
+
+class BulkError(Exception):
+    """Some rows are invalid; ``results`` has every row's outcome. Nothing was written."""
+
+    def __init__(self, results):
+        super().__init__(results)
+        self.results = results
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _invalidate(project_ids, user_ids):
+    owners = Project.objects.filter(pk__in=project_ids).values_list("owner_id", flat=True)
+    caching.invalidate(*owners, *user_ids)
+
+
+def _assignee(username):
+    if not username:
+        return None
+    try:
+        return User.objects.get(**{User.USERNAME_FIELD: username})
+    except User.DoesNotExist:
+        raise ValidationError({"value": ["No user with that username."]})
+
+
+def change(tasks, action, ids, value=None):
+    """Apply ``action`` with ``value`` to the tasks ``ids``, which must all be
+    in ``tasks`` (those the user may change). Returns one result per id."""
+    if action not in ACTIONS:
+        raise ValidationError({"action": [f"Expected one of: {', '.join(ACTIONS)}."]})
+    if not isinstance(ids, list) or not ids or len(ids) > MAX_ROWS:
+        raise ValidationError({"ids": [f"Expected a list of 1 to {MAX_ROWS} task ids."]})
+    if action == "assign":
+        value = _assignee(value)
+    elif action != "delete":
+        try:
+            value = Task._meta.get_field(action).clean(value, None)
+        except ValidationError as e:
+            raise ValidationError({"value": e.messages})
+
+    found = {pk: (project_id, assignee_id) for pk, project_id, assignee_id in
+             tasks.filter(pk__in=[_int(pk) for pk in ids if _int(pk) is not None])
+             .values_list("id", "project_id", "assignee_id")}
+    results = []
+    for pk in ids:
+        if _int(pk) in found:
+            results.append({"id": _int(pk), "ok": True})
+        else:
+            results.append({"id": pk, "ok": False, "errors": {"id": ["Task not found."]}})
+    if not all(r["ok"] for r in results):
+        raise BulkError(results)
+
+    with transaction.atomic():
+        selected = Task.objects.filter(pk__in=found)
+        if action == "delete":
+            with caching.suspended():
+                selected.delete()
+        else:
+            field = "assignee" if action == "assign" else action
+            selected.update(**{field: value, "updated_at": timezone.now()})
+        assignees = {assignee_id for _, assignee_id in found.values()}
+        if action == "assign" and value is not None:
+            assignees.add(value.pk)
+        _invalidate({project_id for project_id, _ in found.values()}, assignees)
+    return results
+
+
+def parse(data, content_type):
+    """Import rows (dicts of column -> value) from a CSV or JSON body. JSON is
+    a list of objects, or an object with the list under "tasks"."""
+    try:
+        if content_type == "text/csv":
+            rows = list(csv.DictReader(io.StringIO(data.decode("utf-8-sig"))))
+        elif content_type == "application/json":
+            rows = json.loads(data)
+            if isinstance(rows, dict):
+                rows = rows.get("tasks")
+        else:
+            raise ValidationError({"__all__": ["Send text/csv or application/json."]})
+    except (UnicodeDecodeError, ValueError, csv.Error):
+        raise ValidationError({"__all__": [f"Malformed {content_type} body."]})
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ValidationError({"__all__": ["Expected a list of tasks."]})
+    if not rows or len(rows) > MAX_ROWS:
+        raise ValidationError({"__all__": [f"Expected 1 to {MAX_ROWS} tasks."]})
+    return rows
+
+
+def _result(number, task, errors):
+    result = {"row": number, "id": task.pk, "ok": not errors}
+    if errors:
+        result["errors"] = errors
+    return result
+
+
+def import_tasks(tasks, projects, rows):
+    """Create the rows without an "id" and update those with one, which must
+    be in ``tasks``. New and moved tasks must go to one of ``projects``.
+    Columns left out keep their current (or default) value."""
+    project_ids = {p.id for p in projects}
+    existing = {t.pk: t for t in tasks.filter(pk__in=[_int(r.get("id")) for r in rows if _int(r.get("id"))])}
+    usernames = {row["assignee"] for row in rows if isinstance(row.get("assignee"), str)}
+    users = {u.get_username(): u for u in User.objects.filter(**{f"{User.USERNAME_FIELD}__in": usernames})}
+    before = {pk: (t.project_id, t.assignee_id) for pk, t in existing.items()}
+
+    checked, creates, updates = [], [], {}  # checked: (row number, task, errors)
+    for number, row in enumerate(rows, 1):
+        errors = {}
+        unknown = set(row) - {"id", *IMPORT_FIELDS}
+        if unknown:
+            errors["__all__"] = [f"Unknown columns: {', '.join(sorted(map(str, unknown)))}."]
+        if row.get("id") not in (None, ""):
+            task = existing.get(_int(row["id"]))
+            if task is None:
+                checked.append((number, Task(pk=row["id"]), {"id": ["Task not found."]}))
+                continue
+        else:
+            task = Task()
+        for name in ("title", "description", "status", "priority", "due_date"):
+            if name in row:
+                setattr(task, name, None if name == "due_date" and row[name] == "" else row[name])
+        if "project" in row:
+            project_id = _int(row["project"])
+            if project_id in project_ids or (task.pk and project_id == before[task.pk][0]):
+                task.project_id = project_id
+            else:
+                errors["project"] = ["Not one of your projects."]
+        elif task.project_id is None:
+            errors["project"] = ["This field is required."]
+        if "assignee" in row:
+            if not row["assignee"]:
+                task.assignee = None
+            elif isinstance(row["assignee"], str) and row["assignee"] in users:
+                task.assignee = users[row["assignee"]]
+            else:
+                errors["assignee"] = ["No user with that username."]
+        try:
+            task.full_clean(exclude=["project", "assignee"])
+        except ValidationError as e:
+            for name, messages in e.message_dict.items():
+                errors.setdefault(name, []).extend(messages)
+        checked.append((number, task, errors))
+        if not errors:
+            if task.pk:
+                updates[task.pk] = task
+            else:
+                creates.append(task)
+
+    if any(errors for _, _, errors in checked):
+        raise BulkError([_result(*c) for c in checked])
+
+    now = timezone.now()
+    with transaction.atomic():
+        Task.objects.bulk_create(creates)
+        for task in updates.values():
+            task.updated_at = now
+        Task.objects.bulk_update(updates.values(), ["updated_at", *IMPORT_FIELDS])
+        written = [*creates, *updates.values()]
+        _invalidate({t.project_id for t in written} | {p for p, _ in before.values()},
+                    {t.assignee_id for t in written} | {a for _, a in before.values()})
+    return [_result(*c) for c in checked]  # new tasks have their ids now
@@ -0,0 +1,124 @@
+"""Per-user cached views of projects and task counts.
+
+Each user's entries are keyed by a generation token. Saving or deleting a
+Project or Task replaces the token of every user who can see it (project
+owner, assignee, before and after the change), so all of that user's
+entries go stale at once and are recomputed on their next read: a page
+hits the database once per change, not once per render. The new token is
+written after the transaction commits, never before a concurrent reader
+could see the change.
+
+queryset.update() and bulk_create() send no signals; code using them calls
+invalidate() for the users concerned. Bulk deletes run in suspended(),
+invalidating once rather than once per task, and a deleted project
+invalidates for all of its tasks, which skip their own lookups.
+"""
+import hashlib
+import secrets
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Project, Task
+
+
+def _generation_key(user_id):
+    return f"tracker:gen:{user_id}"
+
+
+def _generation(user_id):
+    # a random token, not a counter: a token evicted and created again must
+    # not bring back entries cached under the old one
+    return cache.get_or_set(_generation_key(user_id), secrets.token_hex(8))
+
+
+def cached(user_id, name, compute, *params):
+    """``compute()`` cached for ``user_id`` until the user's data changes."""
+    digest = hashlib.md5(repr(params).encode()).hexdigest()
+    return cache.get_or_set(f"tracker:{user_id}:{_generation(user_id)}:{name}:{digest}", compute)
+
+
+def invalidate(*user_ids):
+    user_ids = {pk for pk in user_ids if pk is not None}
+    if user_ids:
+        transaction.on_commit(lambda: cache.set_many(
+            {_generation_key(pk): secrets.token_hex(8) for pk in user_ids}))
+
+
+_local = threading.local()
+
+
+@contextmanager
+def suspended():
+    """Skip the save/delete receivers in this block; the caller invalidates."""
+    _local.suspended = True
+    try:
+        yield
+    finally:
+        _local.suspended = False
+
+
+def user_projects(user):
+    """The user's own projects (id and name only), by name."""
+    return cached(user.pk, "projects",
+                  lambda: list(Project.objects.filter(owner=user).only("id", "name")))
+
+
+def project_summaries(user):
+    """The user's own projects, each with ``task_count`` and ``status_counts``
+    (label, count) for every status."""
+    def compute():
+        projects = list(Project.objects.filter(owner=user))
+        counts = {}
+        rows = (Task.objects.filter(project__owner=user)
+                .values_list("project_id", "status").annotate(n=Count("id")).order_by())
+        for project_id, status, n in rows:
+            counts.setdefault(project_id, {})[status] = n
+        for project in projects:
+            mine = counts.get(project.id, {})
+            project.task_count = sum(mine.values())
+            project.status_counts = [(label, mine.get(value, 0)) for value, label in Task.Status.choices]
+        return projects
+    return cached(user.pk, "project-summaries", compute)
+
+
+def task_count(user, params, count):
+    """Size of one filtered task list of the user; ``params`` identify the filters."""
+    return cached(user.pk, "task-count", count, *params)
+
+
+@receiver(pre_delete, sender=Project)
+def _project_deleting(sender, instance, **kwargs):
+    if getattr(_local, "suspended", False):
+        return
+    # read while the tasks are still there; see _project_changed
+    instance._assignee_ids = set(Task.objects.filter(project=instance).exclude(assignee=None)
+                                 .values_list("assignee_id", flat=True).order_by().distinct())
+
+
+@receiver([post_save, post_delete], sender=Project)
+def _project_changed(sender, instance, **kwargs):
+    if getattr(_local, "suspended", False):
+        return
+    invalidate(instance.owner_id, instance._loaded_values.get("owner_id"),
+               *getattr(instance, "_assignee_ids", ()))
+
+
+def _deleted_with_project(origin):
+    # Project.delete() or a queryset of projects cascading to their tasks
+    return isinstance(origin, Project) or getattr(origin, "model", None) is Project
+
+
+@receiver([post_save, post_delete], sender=Task)
+def _task_changed(sender, instance, **kwargs):
+    if getattr(_local, "suspended", False) or _deleted_with_project(kwargs.get("origin")):
+        return
+    loaded = instance._loaded_values
+    project_ids = {instance.project_id, loaded.get("project_id")} - {None}
+    owners = Project.objects.filter(pk__in=project_ids).values_list("owner_id", flat=True)
+    invalidate(*owners, instance.assignee_id, loaded.get("assignee_id"))
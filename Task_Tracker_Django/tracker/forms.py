@@ -1,14 +1,41 @@
 from django import forms
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.urls import reverse_lazy
+
 from .models import Project, Task
 
+User = get_user_model()
+
 class ProjectForm(forms.ModelForm):
     class Meta:
         model = Project
         fields = ["name", "description"]
 
+class AssigneeInput(forms.TextInput):
+    """A username box completed from the user-autocomplete endpoint, so the
+    form never lists every user the way a <select> would."""
+
+    def __init__(self, attrs=None):
+        super().__init__({"list": "assignee-options", "autocomplete": "off",
+                          "data-autocomplete-url": reverse_lazy("user-autocomplete"), **(attrs or {})})
+
 class TaskForm(forms.ModelForm):
     due_date = forms.DateField(required=False, widget=forms.DateInput(attrs={"type": "date"}))
+    assignee = forms.ModelChoiceField(
+        User.objects.all(), to_field_name=User.USERNAME_FIELD, required=False, widget=AssigneeInput,
+        error_messages={"invalid_choice": "No user with that username."})
 
     class Meta:
         model = Task
-        fields = ["project", "title", "description", "assignee", "status", "priority", "due_date"]
\ No newline at end of file
+        fields = ["project", "title", "description", "assignee", "status", "priority", "due_date"]
+
+    def __init__(self, *args, user, **kwargs):
+        super().__init__(*args, **kwargs)
+        # own projects, plus the current one of a task assigned from elsewhere
+        projects = Q(owner=user)
+        if self.instance.project_id:
+            projects |= Q(pk=self.instance.project_id)
+        self.fields["project"].queryset = Project.objects.filter(projects)
+        if self.instance.assignee_id:
+            self.initial["assignee"] = self.instance.assignee.get_username()
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0002_task_project_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='task',
+            options={'ordering': ['-priority', 'due_date', 'title', 'id']},
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from tracker import search
+    search.backend(schema_editor.connection.alias).install(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from tracker import search
+    search.backend(schema_editor.connection.alias).uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0003_task_ordering_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -3,19 +3,42 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-class Project(models.Model):
+class LoadedValuesMixin:
+    """Remembers the column values an instance was read with, so a change
+    can be told apart from the state before it (see tracker.caching)."""
+    _loaded_values = {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers have seen the old values; the saved ones are
+        # what the next change starts from (deferred fields stay unknown)
+        self._loaded_values = {f.attname: self.__dict__[f.attname] for f in self._meta.concrete_fields
+                               if f.attname in self.__dict__}
+
+class Project(LoadedValuesMixin, models.Model):
     name = models.CharField(max_length=120)
     description = models.TextField(blank=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="projects")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["name"]
+        indexes = [
+            # "my projects" lists and the owner half of TaskListView's filter
+            models.Index(fields=["owner", "name"], name="project_owner_name_idx"),
+        ]
 
     def __str__(self):
         return self.name
 
-class Task(models.Model):
+class Task(LoadedValuesMixin, models.Model):
     class Status(models.TextChoices):
         TODO = "todo", "To Do"
         IN_PROGRESS = "doing", "In Progress"
@@ -37,7 +60,19 @@ class Task(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ["-priority", "due_date", "title"]
+        ordering = ["-priority", "due_date", "title", "id"]
+        # TaskListView reads a user's tasks as "in one of my projects OR
+        # assigned to me", optionally narrowed by status, in Meta.ordering.
+        # Each side of the OR gets its own index so the planner can search
+        # both and merge them; project/status filters then read one index
+        # range already in list order. "id" makes the order total, which the
+        # list's keyset pages need; index entries already end with it.
+        indexes = [
+            models.Index(fields=["project", "status", "-priority", "due_date", "title"],
+                         name="task_project_status_order_idx"),
+            models.Index(fields=["assignee", "status", "-priority", "due_date", "title"],
+                         name="task_assignee_status_order_idx"),
+        ]
 
     def __str__(self):
         return self.title
\ No newline at end of file
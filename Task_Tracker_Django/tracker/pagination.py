@@ -0,0 +1,144 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    def default(value):
+        if isinstance(value, datetime.date):
+            return {"date": value.isoformat()}
+        raise TypeError(value)
+    raw = json.dumps(values, default=default, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, fields):
+    """The values in ``cursor``, converted by ``fields`` (one per value)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw, object_hook=lambda d: datetime.date.fromisoformat(d["date"]))
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise InvalidCursor(cursor)
+    try:
+        return [None if value is None else field.to_python(value) for field, value in zip(fields, values)]
+    except (ValidationError, TypeError, ValueError):
+        raise InvalidCursor(cursor)
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset, with cursors for its neighbours."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate on the values of the last row seen instead of OFFSET.
+
+    ``ordering`` is a list of field names as for ``order_by()`` ("-priority");
+    it must end with a unique field. A page is found with an index range
+    scan however deep it is, and rows added or removed elsewhere in the list
+    do not shift it. Nullable fields follow the database's NULL ordering;
+    annotations (a search rank) are taken to be never NULL."""
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+        self.per_page = per_page
+        self.fields = [self._field(queryset, name) for name, _ in self.ordering]
+        self.nullable = {name: field.null for (name, _), field in zip(self.ordering, self.fields)}
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+
+    @staticmethod
+    def _field(queryset, name):
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            field = queryset.query.annotations[name].output_field.clone()
+            field.null = False
+            return field
+
+    def _order_by(self, reverse):
+        return [("-" if desc != reverse else "") + name for name, desc in self.ordering]
+
+    def _after(self, name, desc, value):
+        """Rows past ``value`` of one field, in the direction given by ``desc``."""
+        nulls_first = self.nulls_largest == desc
+        if value is None:
+            return Q(**{f"{name}__isnull": False}) if nulls_first else None
+        q = Q(**{f"{name}__{'lt' if desc else 'gt'}": value})
+        if self.nullable[name] and not nulls_first:
+            q |= Q(**{f"{name}__isnull": True})
+        return q
+
+    def _equal(self, name, value):
+        return Q(**{f"{name}__isnull": True}) if value is None else Q(**{name: value})
+
+    def _seek(self, values, reverse):
+        # (a, b, c) after (x, y, z): a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, desc), value in zip(self.ordering, values):
+            after = self._after(name, desc != reverse, value)
+            if after is not None:
+                condition |= equal & after
+            equal &= self._equal(name, value)
+        # Redundant with the above, but a plain range on the leading field
+        # lets the database start its index scan at the cursor.
+        (name, desc), value = self.ordering[0], values[0]
+        if value is not None and not self.nullable[name]:
+            condition &= Q(**{f"{name}__{'lte' if desc != reverse else 'gte'}": value})
+        return condition
+
+    def _cursor(self, obj):
+        return encode_cursor([getattr(obj, name) for name, _ in self.ordering])
+
+    def page(self, after=None, before=None):
+        """The page following the ``after`` cursor, preceding ``before``, or the first one."""
+        reverse = before is not None
+        qs = self.queryset.order_by(*self._order_by(reverse))
+        cursor = before if reverse else after
+        if cursor:
+            qs = qs.filter(self._seek(decode_cursor(cursor, self.fields), reverse))
+        rows = list(qs[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows, None, None)
+        has_next = more if not reverse else True
+        has_previous = more if reverse else bool(cursor)
+        return KeysetPage(
+            rows,
+            self._cursor(rows[-1]) if has_next else None,
+            self._cursor(rows[0]) if has_previous else None,
+        )
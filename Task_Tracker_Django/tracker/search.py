@@ -0,0 +1,161 @@
+"""Full-text search over task titles and descriptions.
+
+Each backend narrows a Task queryset to the tasks matching a search and
+annotates them with ``rank`` (lower is a better match), ordered best first.
+The backend follows the database vendor; set TRACKER_SEARCH_BACKEND to the
+dotted path of a SearchBackend subclass to use another one.
+
+Indexes are maintained by the database itself (triggers, a generated
+column), so saves, deletes, bulk_create() and update() all reach them.
+Migration 0004 installs them, and every ``migrate`` that leaves 0004
+applied checks them again: SQLite drops a table's triggers whenever
+Django rebuilds the table to alter it.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+
+def terms(text):
+    return re.findall(r"\w+", text)
+
+
+class SearchBackend:
+    """Case-insensitive substring match on any database, unranked."""
+
+    def install(self, connection):
+        pass
+
+    def uninstall(self, connection):
+        pass
+
+    def search(self, queryset, text):
+        words = terms(text)
+        if not words:
+            return queryset.none()
+        for word in words:
+            queryset = queryset.filter(Q(title__icontains=word) | Q(description__icontains=word))
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField())).order_by(
+            "rank", *queryset.model._meta.ordering)
+
+
+class SqliteSearch(SearchBackend):
+    """SQLite FTS5 index tracker_task_fts, ranked by BM25 with titles
+    weighing ten times the description. Every word of the search must
+    match, as a word or a prefix ("deplo" finds "deploy")."""
+
+    table = "tracker_task_fts"
+    weights = (10.0, 1.0)  # title, description
+    triggers = {
+        "ai": "AFTER INSERT ON tracker_task BEGIN {insert} END",
+        "ad": "AFTER DELETE ON tracker_task BEGIN {delete} END",
+        "au": "AFTER UPDATE OF title, description ON tracker_task BEGIN {delete} {insert} END",
+    }
+
+    def install(self, connection):
+        t = self.table
+        insert = f"INSERT INTO {t}(rowid, title, description) VALUES (new.id, new.title, new.description);"
+        delete = (f"INSERT INTO {t}({t}, rowid, title, description) "
+                  f"VALUES ('delete', old.id, old.title, old.description);")
+        with connection.cursor() as cursor:
+            # external content: the index stores no second copy of the text
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {t} USING fts5(title, description, "
+                f"content='tracker_task', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'tracker_task'")
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [name for name in self.triggers if f"{t}_{name}" not in existing]
+            for name in missing:
+                body = self.triggers[name].format(insert=insert, delete=delete)
+                cursor.execute(f"CREATE TRIGGER {t}_{name} {body}")
+            if missing:
+                # writes made while the triggers were absent
+                cursor.execute(f"INSERT INTO {t}({t}) VALUES ('rebuild')")
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            for name in self.triggers:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {self.table}_{name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def match(self, words):
+        # quoted, so the words are never read as FTS5 operators
+        return " ".join(f'"{word}"*' for word in words)
+
+    def search(self, queryset, text):
+        words = terms(text)
+        if not words:
+            return queryset.none()
+        match = self.match(words)
+        table = queryset.model._meta.db_table
+        weights = ", ".join(str(w) for w in self.weights)
+        rank = RawSQL(
+            f'SELECT bm25({self.table}, {weights}) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = "{table}"."id"',
+            [match], output_field=FloatField())
+        ids = RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match])
+        return queryset.filter(id__in=ids).annotate(rank=rank).order_by("rank", "id")
+
+
+class PostgresSearch(SearchBackend):
+    """The tsvector column tracker_task.search_vector (titles weighted A,
+    descriptions B) with a GIN index; ``websearch_to_tsquery`` syntax,
+    ranked by ``ts_rank_cd``."""
+
+    config = "english"
+
+    def install(self, connection):
+        vector = (f"setweight(to_tsvector('{self.config}', coalesce(title, '')), 'A') || "
+                  f"setweight(to_tsvector('{self.config}', coalesce(description, '')), 'B')")
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE tracker_task ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                           f"GENERATED ALWAYS AS ({vector}) STORED")
+            cursor.execute("CREATE INDEX IF NOT EXISTS tracker_task_search_idx "
+                           "ON tracker_task USING GIN (search_vector)")
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP INDEX IF EXISTS tracker_task_search_idx")
+            cursor.execute("ALTER TABLE tracker_task DROP COLUMN IF EXISTS search_vector")
+
+    def search(self, queryset, text):
+        if not terms(text):
+            return queryset.none()
+        table = queryset.model._meta.db_table
+        query = f"websearch_to_tsquery('{self.config}', %s)"
+        matches = RawSQL(f'"{table}"."search_vector" @@ {query}', [text], output_field=BooleanField())
+        rank = RawSQL(f'-ts_rank_cd("{table}"."search_vector", {query})', [text], output_field=FloatField())
+        return queryset.filter(matches).annotate(rank=rank).order_by("rank", "id")
+
+
+BACKENDS = {"sqlite": SqliteSearch, "postgresql": PostgresSearch}
+
+
+def backend(using="default"):
+    """The search backend for database ``using``."""
+    path = getattr(settings, "TRACKER_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    return BACKENDS.get(connections[using].vendor, SearchBackend)()
+
+
+def search(queryset, text):
+    return backend(queryset.db).search(queryset, text)
+
+
+INDEX_MIGRATION = ("tracker", "0004_task_search_index")
+
+
+def install(using="default", **kwargs):
+    """(Re)create the search index of database ``using``; a post_migrate
+    receiver. Does nothing while the database is migrated back before 0004."""
+    connection = connections[using]
+    if INDEX_MIGRATION not in MigrationRecorder(connection).applied_migrations():
+        return
+    backend(using).install(connection)
@@ -1,3 +1,703 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection, models
+from django.http import QueryDict
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import caching, search
+from .forms import TaskForm
+from .models import Project, Task
+from .pagination import KeysetPaginator
+from .views import TaskListView
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == "sqlite", "plans are checked against SQLite")
+class TaskListQueryPlanTests(TestCase):
+    """The task list queries must be answered from the composite indexes,
+    never by scanning the whole task table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner", password="x")
+        other = User.objects.create_user("other", password="x")
+        # the user sees a small slice: one project of 50, a few assignments
+        mine = Project.objects.create(name="Mine", owner=cls.user)
+        theirs = Project.objects.bulk_create(
+            Project(name=f"Project {i}", owner=other) for i in range(49)
+        )
+        Task.objects.bulk_create(
+            Task(project=mine if i % 50 == 0 else theirs[i % 49], title=f"Task {i}",
+                 assignee=cls.user if i % 40 == 0 else other,
+                 status=Task.Status.values[i % 3], priority=i % 3 + 1)
+            for i in range(5000)
+        )
+        cls.project = mine
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def plan(self, **params):
+        request = RequestFactory().get("/tasks/", params)
+        request.user = self.user
+        view = TaskListView()
+        view.setup(request)
+        return view.get_queryset()[:15].explain()
+
+    def assertNoFullScan(self, plan):
+        for line in plan.splitlines():
+            self.assertFalse("SCAN tracker_task" in line and "USING" not in line, plan)
+
+    def test_user_tasks_search_both_sides_of_the_or(self):
+        plan = self.plan()
+        self.assertIn("MULTI-INDEX OR", plan)
+        self.assertNoFullScan(plan)
+
+    def test_status_filter_uses_composite_indexes(self):
+        plan = self.plan(status="todo")
+        self.assertIn("MULTI-INDEX OR", plan)
+        self.assertIn("task_project_status_order_idx", plan)
+        self.assertIn("task_assignee_status_order_idx", plan)
+        self.assertNoFullScan(plan)
+
+    def test_project_and_status_read_in_list_order(self):
+        plan = self.plan(project=self.project.pk, status="todo")
+        self.assertIn("task_project_status_order_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+        self.assertNoFullScan(plan)
+
+    def test_owner_projects_in_name_order(self):
+        plan = Project.objects.filter(owner=self.user).explain()
+        self.assertIn("project_owner_name_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_list_shows_own_and_assigned_tasks_only(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("task-list"), {"status": "todo"})
+        self.assertEqual(response.status_code, 200)
+        expected = Task.objects.filter(status="todo").filter(
+            models.Q(project__owner=self.user) | models.Q(assignee=self.user))
+        self.assertEqual(response.context["task_count"], expected.count())
+        for task in response.context["tasks"]:
+            self.assertTrue(task.project.owner_id == self.user.pk or task.assignee_id == self.user.pk)
+
+    def test_deep_keyset_page_seeks_into_the_index(self):
+        request = RequestFactory().get("/tasks/", {"project": self.project.pk, "status": "todo"})
+        request.user = self.user
+        view = TaskListView()
+        view.setup(request)
+        paginator = KeysetPaginator(view.get_queryset(), Task._meta.ordering, 15)
+        last = Task.objects.filter(project=self.project, status="todo").last()
+        qs = paginator.queryset.order_by(*paginator._order_by(False)).filter(
+            paginator._seek([last.priority, last.due_date, last.title, last.pk], False))
+        plan = qs[:16].explain()
+        self.assertIn("task_project_status_order_idx (project_id=? AND status=? AND priority<?)", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+class TaskListKeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner", password="x")
+        cls.project = Project.objects.create(name="Mine", owner=cls.user)
+        # few distinct sort keys: ties on priority/due date/title, and
+        # undated tasks, must neither repeat nor drop rows across pages
+        Task.objects.bulk_create(
+            Task(project=cls.project, title=f"Task {i % 7}", priority=i % 3 + 1,
+                 status=Task.Status.values[i % 2],
+                 due_date=None if i % 4 == 0 else datetime.date(2024, 1, 1 + i % 5))
+            for i in range(100)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get(self, **params):
+        response = self.client.get(reverse("task-list"), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def walk(self, direction, **params):
+        """Pks of all pages following the Next (or Prev) links, and the last response."""
+        pages = []
+        while True:
+            response = self.get(**params)
+            pages.append([t.pk for t in response.context["tasks"]])
+            link = response.context.get(f"{direction}_query")
+            if not link:
+                return pages, response
+            params = QueryDict(link).dict()
+
+    def test_next_links_walk_the_whole_list_once_in_order(self):
+        pages, _ = self.walk("next")
+        expected = list(Task.objects.values_list("pk", flat=True))
+        self.assertEqual(len(pages), 7)
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+    def test_prev_links_walk_back_through_the_same_pages(self):
+        forward, last = self.walk("next", status="todo")
+        query = QueryDict(last.context["previous_query"]).dict()
+        self.assertEqual(query["status"], "todo")
+        backward, _ = self.walk("previous", **query)
+        self.assertEqual(backward[::-1], forward[:-1])
+
+    def test_search_results_page_by_rank(self):
+        pages, _ = self.walk("next", q="task")
+        expected = [t.pk for t in search.search(Task.objects.all(), "task")]
+        self.assertEqual(len(pages), 7)
+        self.assertEqual([pk for page in pages for pk in page], expected)
+
+    def test_pages_do_not_count_again(self):
+        first = self.get()
+        self.assertEqual(first.context["task_count"], 100)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.get(after=QueryDict(first.context["next_query"])["after"])
+        self.assertEqual(second.context["task_count"], 100)
+        self.assertFalse([q for q in queries if "COUNT(" in q["sql"]])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse("task-list"), {"after": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor_is_not_found(self):
+        for values in ([2, None, "x", "zz"], ["high", None, "x", 1], [2, {"date": "2024-13-01"}, "x", 1],
+                       [2, "soon", "x", 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            response = self.client.get(reverse("task-list"), {"after": cursor})
+            self.assertEqual(response.status_code, 404, values)
+        for values in ([2, None, "x", 1], [2, {"date": "2024-01-03"}, "Task 1", 5]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            self.get(after=cursor)
+
+    def test_numbered_pages_still_work(self):
+        response = self.get(page=2)
+        self.assertEqual(response.context["page_obj"].number, 2)
+        self.assertEqual(response.context["paginator"].count, 100)
+
+
+@skipUnless(connection.vendor == "sqlite", "FTS5 index")
+class TaskSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner", password="x")
+        other = User.objects.create_user("other", password="x")
+        cls.project = Project.objects.create(name="Mine", owner=cls.user)
+        cls.hidden = Project.objects.create(name="Theirs", owner=other)
+        cls.in_title = Task.objects.create(project=cls.project, title="Deploy the release")
+        cls.in_description = Task.objects.create(
+            project=cls.project, title="Write notes", description="Notes for the deploy")
+        Task.objects.create(project=cls.hidden, title="Deploy their service")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def find(self, text, queryset=None):
+        return [t.pk for t in search.search(queryset or Task.objects.all(), text)]
+
+    def test_saves_and_deletes_reach_the_index(self):
+        task = Task.objects.create(project=self.project, title="Rotate certificates")
+        self.assertEqual(self.find("certificates"), [task.pk])
+        task.title = "Renew keys"
+        task.save()
+        self.assertEqual(self.find("certificates"), [])
+        self.assertEqual(self.find("keys"), [task.pk])
+        task.delete()
+        self.assertEqual(self.find("keys"), [])
+
+    def test_bulk_writes_reach_the_index(self):
+        created = Task.objects.bulk_create(
+            Task(project=self.project, title=f"Migrate table {i}") for i in range(3))
+        self.assertCountEqual(self.find("migrate"), [t.pk for t in created])
+        Task.objects.filter(pk=created[0].pk).update(description="postponed")
+        self.assertEqual(self.find("postponed"), [created[0].pk])
+        Task.objects.filter(title__startswith="Migrate").delete()
+        self.assertEqual(self.find("migrate"), [])
+
+    def test_title_matches_rank_first(self):
+        mine = Task.objects.filter(project=self.project)
+        self.assertEqual(self.find("deploy", mine), [self.in_title.pk, self.in_description.pk])
+
+    def test_words_match_as_prefixes_and_all_must_match(self):
+        self.assertEqual(len(self.find("depl")), 3)
+        self.assertEqual(self.find("deploy notes"), [self.in_description.pk])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.find('deploy" OR (NEAR *'), [])
+        self.assertEqual(self.find("-- !!"), [])
+
+    def test_install_restores_missing_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER tracker_task_fts_ai")
+        task = Task.objects.create(project=self.project, title="Unindexed task")
+        self.assertEqual(self.find("unindexed"), [])
+        search.install(connection.alias)
+        self.assertEqual(self.find("unindexed"), [task.pk])
+
+    def test_list_search_shows_own_matches_best_first(self):
+        response = self.client.get(reverse("task-list"), {"q": "deploy"})
+        self.assertEqual([t.pk for t in response.context["tasks"]],
+                         [self.in_title.pk, self.in_description.pk])
+        self.assertEqual(response.context["task_count"], 2)
+
+    def test_search_reads_the_fts_index(self):
+        qs = search.search(Task.objects.filter(project=self.project), "deploy")
+        plan = qs.explain()
+        self.assertIn("VIRTUAL TABLE INDEX", plan)
+        self.assertNotIn("LIKE", str(qs.query))
+
+
+@skipUnless(connection.vendor == "sqlite", "FTS5 index")
+class SearchMigrationTests(TransactionTestCase):
+    def search_objects(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE name LIKE 'tracker_task_fts%%' "
+                           "AND type IN ('table', 'trigger')")
+            return {row[0] for row in cursor.fetchall()}
+
+    def migrate(self, *target):
+        call_command("migrate", "tracker", *target, verbosity=0)
+
+    def test_rolling_back_removes_the_index(self):
+        installed = {"tracker_task_fts", "tracker_task_fts_ai", "tracker_task_fts_ad", "tracker_task_fts_au"}
+        self.assertTrue(installed <= self.search_objects())
+        try:
+            self.migrate("0003")
+            self.assertEqual(self.search_objects(), set())
+            self.migrate("zero")
+            self.assertNotIn("tracker_task", connection.introspection.table_names())
+        finally:
+            self.migrate()
+        self.assertTrue(installed <= self.search_objects())
+
+
+class QueryBudgetTests(TestCase):
+    """Each page runs a fixed number of queries, however many users,
+    projects and tasks there are."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner", password="x")
+        User.objects.bulk_create(User(username=f"user{i:03}") for i in range(300))
+        cls.colleague = User.objects.get(username="user042")
+        projects = Project.objects.bulk_create(Project(name=f"Project {i}", owner=cls.user) for i in range(20))
+        Project.objects.create(name="Elsewhere", owner=cls.colleague)
+        Task.objects.bulk_create(
+            Task(project=projects[i % 20], title=f"Task {i}", assignee=cls.colleague if i % 2 else None)
+            for i in range(100)
+        )
+        cls.task = Task.objects.filter(assignee=cls.colleague).first()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_task_list(self):
+        # session, user, own projects, tasks, their projects, total count
+        with self.assertNumQueries(6):
+            self.client.get(reverse("task-list"))
+        with self.assertNumQueries(4):  # own projects and count now cached
+            self.client.get(reverse("task-list"))
+
+    def test_task_detail(self):
+        with self.assertNumQueries(3):  # session, user, task with project and assignee
+            self.client.get(reverse("task-detail", args=[self.task.pk]))
+
+    def test_task_create_form(self):
+        with self.assertNumQueries(3):  # session, user, project choices
+            response = self.client.get(reverse("task-create"))
+        self.assertNotContains(response, "user001")
+
+    def test_task_update_form(self):
+        with self.assertNumQueries(4):  # session, user, task with assignee, project choices
+            response = self.client.get(reverse("task-update", args=[self.task.pk]))
+        self.assertContains(response, 'value="user042"')
+        self.assertNotContains(response, "user001")
+
+    def test_task_create(self):
+        data = {"project": self.task.project_id, "title": "New", "assignee": "user042",
+                "status": "todo", "priority": 2}
+        # session, user, project and assignee (form fields, then model
+        # validation again), insert, project owner for cache invalidation
+        with self.assertNumQueries(8):
+            response = self.client.post(reverse("task-create"), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Task.objects.get(title="New").assignee, self.colleague)
+
+    def test_project_delete(self):
+        project = Project.objects.create(name="Doomed", owner=self.user)
+        Task.objects.bulk_create(Task(project=project, title=f"Doomed {i}", assignee=self.colleague)
+                                 for i in range(50))
+        # assignees for cache invalidation, the tasks to cascade to, delete
+        # the tasks, delete the project; not one query per task
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(4):
+            project.delete()
+
+    def test_project_list(self):
+        with self.assertNumQueries(4):  # session, user, projects, task counts
+            self.client.get(reverse("project-list"))
+        with self.assertNumQueries(2):  # session, user; the rest is cached
+            response = self.client.get(reverse("project-list"))
+        self.assertContains(response, "5 tasks")
+
+    def test_user_autocomplete(self):
+        with self.assertNumQueries(3):  # session, user, matches
+            response = self.client.get(reverse("user-autocomplete"), {"q": "user04"})
+        names = [u["username"] for u in response.json()["results"]]
+        self.assertEqual(names, [f"user04{i}" for i in range(10)])
+
+
+class TaskFormTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner", password="x")
+        other = User.objects.create_user("other", password="x")
+        cls.mine = Project.objects.create(name="Mine", owner=cls.user)
+        cls.theirs = Project.objects.create(name="Theirs", owner=other)
+
+    def form(self, instance=None, **data):
+        data = {"title": "T", "status": "todo", "priority": 2, **data}
+        return TaskForm(data, instance=instance, user=self.user)
+
+    def test_projects_are_the_users_own(self):
+        self.assertTrue(self.form(project=self.mine.pk).is_valid())
+        self.assertIn("project", self.form(project=self.theirs.pk).errors)
+
+    def test_assigned_task_keeps_its_project(self):
+        task = Task.objects.create(project=self.theirs, title="T", assignee=self.user)
+        self.assertTrue(self.form(task, project=self.theirs.pk).is_valid())
+
+    def test_unknown_assignee_is_rejected(self):
+        form = self.form(project=self.mine.pk, assignee="nobody")
+        self.assertEqual(form.errors["assignee"], ["No user with that username."])
+
+
+class CacheInvalidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner", password="x")
+        cls.other = User.objects.create_user("other", password="x")
+        cls.project = Project.objects.create(name="Mine", owner=cls.user)
+        cls.theirs = Project.objects.create(name="Theirs", owner=cls.other)
+
+    def setUp(self):
+        cache.clear()
+
+    def count(self, user, **filters):
+        params = [filters.get(k, "") for k in ("q", "status", "project")]
+        visible = Task.objects.filter(models.Q(project__owner=user) | models.Q(assignee=user))
+        return caching.task_count(user, params, visible.filter(**filters).count)
+
+    def test_project_changes_reach_the_owners_lists(self):
+        self.assertEqual([p.name for p in caching.user_projects(self.user)], ["Mine"])
+        with self.captureOnCommitCallbacks(execute=True):
+            project = Project.objects.create(name="Another", owner=self.user)
+        self.assertEqual([p.name for p in caching.user_projects(self.user)], ["Another", "Mine"])
+        with self.captureOnCommitCallbacks(execute=True):
+            project.delete()
+        self.assertEqual([p.name for p in caching.user_projects(self.user)], ["Mine"])
+
+    def test_reads_between_changes_are_cached(self):
+        caching.project_summaries(self.user)
+        caching.user_projects(self.user)
+        with self.assertNumQueries(0):
+            caching.project_summaries(self.user)
+            caching.user_projects(self.user)
+
+    def test_task_changes_reach_status_counts(self):
+        def todo():
+            [summary] = caching.project_summaries(self.user)
+            return dict(summary.status_counts)["To Do"]
+        self.assertEqual(todo(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(project=self.project, title="T")
+        self.assertEqual(todo(), 1)
+        task = Task.objects.get(pk=task.pk)
+        task.status = Task.Status.DONE
+        with self.captureOnCommitCallbacks(execute=True):
+            task.save()
+        self.assertEqual(todo(), 0)
+
+    def test_reassignment_reaches_old_and_new_assignee(self):
+        third = User.objects.create_user("third", password="x")
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(project=self.theirs, title="T", assignee=self.user)
+        self.assertEqual(self.count(self.user), 1)
+        self.assertEqual(self.count(third), 0)
+        task = Task.objects.get(pk=task.pk)
+        task.assignee = third
+        with self.captureOnCommitCallbacks(execute=True):
+            task.save()
+        self.assertEqual(self.count(self.user), 0)
+        self.assertEqual(self.count(third), 1)
+
+    def test_second_save_of_one_instance_reaches_the_previous_assignee(self):
+        third = User.objects.create_user("third", password="x")
+        fourth = User.objects.create_user("fourth", password="x")
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(project=self.theirs, title="T", assignee=self.user)
+        for old, new in ((self.user, third), (third, fourth)):
+            self.assertEqual(self.count(old), 1)
+            self.assertEqual(self.count(new), 0)
+            task.assignee = new
+            with self.captureOnCommitCallbacks(execute=True):
+                task.save()
+            self.assertEqual(self.count(old), 0)
+            self.assertEqual(self.count(new), 1)
+
+    def test_project_deletion_reaches_owner_and_assignees(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(project=self.theirs, title="T", assignee=self.user)
+        self.assertEqual(self.count(self.user), 1)
+        self.assertEqual(self.count(self.other), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.theirs.delete()
+        self.assertEqual(self.count(self.user), 0)
+        self.assertEqual(self.count(self.other), 0)
+
+    def test_other_users_entries_survive(self):
+        caching.user_projects(self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(project=self.project, title="T")
+        with self.assertNumQueries(0):
+            caching.user_projects(self.other)
+
+    def test_invalidation_waits_for_commit(self):
+        caching.user_projects(self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Project.objects.create(name="Another", owner=self.user)
+            with self.assertNumQueries(0):
+                caching.user_projects(self.user)  # not committed yet
+        self.assertEqual(len(callbacks), 1)
+
+
+class BulkTaskTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner", password="x")
+        cls.other = User.objects.create_user("other", password="x")
+        cls.project = Project.objects.create(name="Mine", owner=cls.user)
+        cls.theirs = Project.objects.create(name="Theirs", owner=cls.other)
+        cls.tasks = Task.objects.bulk_create(Task(project=cls.project, title=f"Task {i}") for i in range(50))
+        cls.hidden = Task.objects.create(project=cls.theirs, title="Hidden")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def bulk(self, **data):
+        return self.client.post(reverse("task-bulk"), data, content_type="application/json")
+
+    def upload(self, body, content_type):
+        return self.client.post(reverse("task-import"), body, content_type=content_type)
+
+    def test_status_change_takes_a_fixed_number_of_queries(self):
+        ids = [t.pk for t in self.tasks]
+        # session, user, own projects, selected tasks, savepoint, update,
+        # project owners, release
+        with self.assertNumQueries(8):
+            response = self.bulk(action="status", ids=ids, value="done")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(r["ok"] for r in response.json()["results"]))
+        self.assertEqual(Task.objects.filter(status="done").count(), 50)
+        self.assertGreater(Task.objects.get(pk=ids[0]).updated_at, self.tasks[0].updated_at)
+
+    def test_one_bad_id_rejects_the_whole_batch(self):
+        response = self.bulk(action="priority", ids=[self.tasks[0].pk, self.hidden.pk], value=3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r["ok"] for r in response.json()["results"]], [True, False])
+        self.assertFalse(Task.objects.filter(priority=3).exists())
+
+    def test_invalid_value(self):
+        response = self.bulk(action="status", ids=[self.tasks[0].pk], value="someday")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("value", response.json()["errors"])
+
+    def test_reassign_and_delete(self):
+        ids = [t.pk for t in self.tasks[:3]]
+        self.assertEqual(self.bulk(action="assign", ids=ids, value="other").status_code, 200)
+        self.assertEqual(Task.objects.filter(assignee=self.other).count(), 3)
+        self.assertEqual(self.bulk(action="delete", ids=ids).status_code, 200)
+        self.assertFalse(Task.objects.filter(pk__in=ids).exists())
+
+    def test_bulk_changes_invalidate_cached_counts(self):
+        self.client.get(reverse("task-list"), {"status": "done"})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bulk(action="status", ids=[self.tasks[0].pk], value="done")
+        response = self.client.get(reverse("task-list"), {"status": "done"})
+        self.assertEqual(response.context["task_count"], 1)
+
+    def test_csv_import_creates_tasks(self):
+        body = ("title,project,assignee,priority,due_date\n"
+                f"Plan sprint,{self.project.pk},other,3,2024-05-01\n"
+                f"Retro,{self.project.pk},,1,\n")
+        response = self.upload(body, "text/csv")
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()["results"]
+        plan = Task.objects.get(pk=results[0]["id"])
+        self.assertEqual((plan.title, plan.assignee, plan.priority, str(plan.due_date)),
+                         ("Plan sprint", self.other, 3, "2024-05-01"))
+        self.assertIsNone(Task.objects.get(pk=results[1]["id"]).due_date)
+
+    def test_json_import_updates_by_id(self):
+        rows = [{"id": t.pk, "status": "doing", "title": t.title + " (carried over)"} for t in self.tasks[:10]]
+        response = self.upload(json.dumps({"tasks": rows}), "application/json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Task.objects.filter(status="doing", title__endswith="(carried over)").count(), 10)
+
+    def test_import_reports_every_bad_row_and_writes_nothing(self):
+        rows = [
+            {"title": "Good", "project": self.project.pk},
+            {"title": "", "project": self.project.pk},
+            {"title": "Elsewhere", "project": self.theirs.pk},
+            {"id": self.hidden.pk, "title": "Not mine"},
+            {"title": "Late", "project": self.project.pk, "due_date": "tomorrow", "color": "red"},
+        ]
+        response = self.upload(json.dumps(rows), "application/json")
+        self.assertEqual(response.status_code, 400)
+        results = response.json()["results"]
+        self.assertEqual([r["ok"] for r in results], [True, False, False, False, False])
+        self.assertIn("title", results[1]["errors"])
+        self.assertIn("project", results[2]["errors"])
+        self.assertIn("id", results[3]["errors"])
+        self.assertEqual(set(results[4]["errors"]), {"__all__", "due_date"})
+        self.assertFalse(Task.objects.filter(title="Good").exists())
+
+    def test_malformed_body(self):
+        self.assertEqual(self.upload("{", "application/json").status_code, 400)
+        self.assertEqual(self.upload("a", "text/plain").status_code, 400)
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner", password="secret")
+        cls.other = User.objects.create_user("other", password="x")
+        cls.project = Project.objects.create(name="Mine", owner=cls.user)
+        cls.theirs = Project.objects.create(name="Theirs", owner=cls.other)
+        cls.tasks = Task.objects.bulk_create(
+            Task(project=cls.project, title=f"Task {i}", status=Task.Status.values[i % 3]) for i in range(30))
+        cls.assigned = Task.objects.create(project=cls.theirs, title="Assigned", assignee=cls.user)
+        Task.objects.create(project=cls.theirs, title="Hidden")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_task_list_filters_paginates_and_selects_fields(self):
+        url = reverse("api-task-list")
+        response = self.client.get(url, {"status": "todo", "fields": "id,title", "limit": 4, "count": 1})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["count"], 11)  # 10 in the project, 1 assigned
+        self.assertEqual(list(data["results"][0]), ["id", "title"])
+        seen = [r["id"] for r in data["results"]]
+        while data["next"]:
+            data = self.client.get(data["next"]).json()
+            seen += [r["id"] for r in data["results"]]
+        expected = Task.objects.filter(models.Q(project=self.project) | models.Q(assignee=self.user),
+                                       status="todo").values_list("pk", flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_task_list_is_scoped_to_the_user(self):
+        titles = {r["title"] for r in self.client.get(reverse("api-task-list"), {"limit": 200}).json()["results"]}
+        self.assertIn("Assigned", titles)
+        self.assertNotIn("Hidden", titles)
+
+    def test_unchanged_task_is_not_modified(self):
+        url = reverse("api-task-detail", args=[self.tasks[0].pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()["title"], "Task 0")
+        etag, modified = response["ETag"], response["Last-Modified"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified).status_code, 304)
+        Task.objects.filter(pk=self.tasks[0].pk).update(
+            title="Renamed", updated_at=self.tasks[0].updated_at + datetime.timedelta(seconds=1))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_renamed_assignee_is_not_served_stale(self):
+        url = reverse("api-task-detail", args=[self.assigned.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()["assignee"], "owner")
+        self.assertNotIn("Last-Modified", response)
+        list_etag = self.client.get(reverse("api-task-list"))["ETag"]
+        User.objects.filter(pk=self.user.pk).update(username="renamed")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["assignee"], "renamed")
+        self.assertEqual(self.client.get(reverse("api-task-list"), HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_unchanged_list_is_not_modified(self):
+        url = reverse("api-task-list")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Task.objects.filter(pk=self.tasks[0].pk).delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_create_update_delete_task(self):
+        response = self.client.post(reverse("api-task-list"), {
+            "project": self.project.pk, "title": "New", "assignee": "other", "status": "todo", "priority": 3,
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 201, response.content)
+        url = response["Location"]
+        self.assertEqual(response.json()["assignee"], "other")
+        response = self.client.patch(url, {"status": "done"}, content_type="application/json",
+                                     HTTP_IF_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.json()["status"], response.json()["assignee"]), ("done", "other"))
+        self.assertEqual(self.client.delete(url, HTTP_IF_MATCH='"stale"').status_code, 412)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_invalid_writes(self):
+        response = self.client.post(reverse("api-task-list"), {"project": self.theirs.pk, "title": ""},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()["errors"]), {"project", "title", "status", "priority"})
+        response = self.client.post(reverse("api-task-list"), "[", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("api-task-list"), {"fields": "title,secret"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tampered_cursor_and_filters_are_bad_requests(self):
+        url = reverse("api-task-list")
+        cursor = base64.urlsafe_b64encode(b'[2,"notadate","x",1]').decode()
+        response = self.client.get(url, {"after": cursor})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("errors", response.json())
+        self.assertEqual(self.client.get(url, {"project": "abc"}).status_code, 400)
+
+    def test_projects(self):
+        response = self.client.post(reverse("api-project-list"), {"name": "Another"}, content_type="application/json")
+        self.assertEqual(response.status_code, 201, response.content)
+        names = [p["name"] for p in self.client.get(reverse("api-project-list")).json()["results"]]
+        self.assertEqual(names, ["Another", "Mine"])
+        url = reverse("api-project-detail", args=[self.theirs.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"errors": {"__all__": ["Not found."]}})
+
+    def test_authentication(self):
+        url = reverse("api-task-list")
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 401)
+        credentials = base64.b64encode(b"owner:secret").decode()
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f"Basic {credentials}").status_code, 200)
+        wrong = base64.b64encode(b"owner:wrong").decode()
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f"Basic {wrong}").status_code, 401)
+
+    def test_session_writes_need_the_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(reverse("api-project-list"), {"name": "X"}, content_type="application/json")
+        self.assertEqual(response.status_code, 403)
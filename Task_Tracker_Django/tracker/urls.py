@@ -1,7 +1,8 @@
 from django.urls import path
+from . import api
 from .views import (
-    TaskListView, TaskCreateView, TaskUpdateView, TaskDetailView, TaskDeleteView,
-    ProjectListCreateView, project_create
+    TaskListView, TaskCreateView, TaskUpdateView, TaskDetailView, TaskDeleteView, task_bulk, task_import,
+    ProjectListCreateView, project_create, user_autocomplete
 )
 
 urlpatterns = [
@@ -10,7 +11,16 @@ urlpatterns = [
     path("tasks/<int:pk>/", TaskDetailView.as_view(), name="task-detail"),
     path("tasks/<int:pk>/edit/", TaskUpdateView.as_view(), name="task-update"),
     path("tasks/<int:pk>/delete/", TaskDeleteView.as_view(), name="task-delete"),
+    path("tasks/bulk/", task_bulk, name="task-bulk"),
+    path("tasks/import/", task_import, name="task-import"),
 
     path("projects/", ProjectListCreateView.as_view(), name="project-list"),
     path("projects/new/", project_create, name="project-create"),
+
+    path("users/autocomplete/", user_autocomplete, name="user-autocomplete"),
+
+    path("api/projects/", api.ProjectListApi.as_view(), name="api-project-list"),
+    path("api/projects/<int:pk>/", api.ProjectDetailApi.as_view(), name="api-project-detail"),
+    path("api/tasks/", api.TaskListApi.as_view(), name="api-task-list"),
+    path("api/tasks/<int:pk>/", api.TaskDetailApi.as_view(), name="api-task-detail"),
 ]
\ No newline at end of file
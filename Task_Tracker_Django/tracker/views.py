@@ -1,12 +1,47 @@
+import json
+
+from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import ValidationError
 from django.db.models import Q
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView, CreateView, UpdateView, DetailView, DeleteView
 
 from .models import Task, Project
+from . import bulk, caching, search
 from .forms import TaskForm, ProjectForm
+from .pagination import InvalidCursor, KeysetPaginator
+
+User = get_user_model()
+
+def user_tasks(user, projects):
+    """The tasks ``user`` may see and change: in one of ``projects`` (their
+    own, from caching.user_projects) or assigned to them."""
+    # project_id IN (my project ids) rather than a join on project.owner:
+    # both sides of the OR are then task columns and SQLite searches each
+    # with its own index (MULTI-INDEX OR). The ids are a list, not a
+    # subquery, and projects are prefetched, not joined; either one makes
+    # the planner fall back to scanning every task.
+    return Task.objects.filter(Q(project__in=[p.id for p in projects]) | Q(assignee=user))
+
+TASK_FILTERS = ("q", "status", "project")
+
+def filter_tasks(qs, params):
+    """The task list filters: ?q= (full-text, best match first), ?status=, ?project=."""
+    q = params.get("q")
+    status = params.get("status")
+    project = params.get("project")
+    if status:
+        qs = qs.filter(status=status)
+    if project:
+        qs = qs.filter(project_id=project)
+    if q:
+        qs = search.search(qs, q)
+    return qs
 
 class TaskListView(LoginRequiredMixin, ListView):
     model = Task
@@ -15,36 +50,56 @@ class TaskListView(LoginRequiredMixin, ListView):
     paginate_by = 15
 
     def get_queryset(self):
-        qs = (
-            Task.objects
-            .select_related("project", "assignee")
-            .filter(Q(project__owner=self.request.user) | Q(assignee=self.request.user))
-        )
-        q = self.request.GET.get("q")
-        status = self.request.GET.get("status")
-        project = self.request.GET.get("project")
-        if q:
-            qs = qs.filter(Q(title__icontains=q) | Q(description__icontains=q))
-        if status:
-            qs = qs.filter(status=status)
-        if project:
-            qs = qs.filter(project_id=project)
-        return qs
-
-class TaskCreateView(LoginRequiredMixin, CreateView):
-    model = Task
+        self.projects = caching.user_projects(self.request.user)
+        qs = user_tasks(self.request.user, self.projects).select_related("assignee").prefetch_related("project")
+        return filter_tasks(qs, self.request.GET)
+
+    def paginate_queryset(self, queryset, page_size):
+        # ?page=N keeps the numbered (OFFSET) pages; otherwise pages are
+        # found from the ?after= / ?before= cursor, as fast deep as first.
+        if "page" in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, queryset.query.order_by or Task._meta.ordering, page_size)
+        try:
+            page = paginator.page(self.request.GET.get("after"), self.request.GET.get("before"))
+        except InvalidCursor:
+            raise Http404("Invalid cursor")
+        return None, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(projects=self.projects, **kwargs)
+        page = context["page_obj"]
+        if context["paginator"] is None and page is not None:
+            query = self.request.GET.copy()
+            for name in ("after", "before", "page"):
+                query.pop(name, None)
+            if page.has_next():
+                query["after"] = page.next_cursor
+                context["next_query"] = query.urlencode()
+                del query["after"]
+            if page.has_previous():
+                query["before"] = page.previous_cursor
+                context["previous_query"] = query.urlencode()
+            params = [self.request.GET.get(k, "") for k in TASK_FILTERS]
+            context["task_count"] = caching.task_count(self.request.user, params, self.object_list.count)
+        return context
+
+class TaskFormMixin:
     form_class = TaskForm
     template_name = "tracker/task_form.html"
     success_url = reverse_lazy("task-list")
 
-class TaskUpdateView(LoginRequiredMixin, UpdateView):
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), "user": self.request.user}
+
+class TaskCreateView(LoginRequiredMixin, TaskFormMixin, CreateView):
     model = Task
-    form_class = TaskForm
-    template_name = "tracker/task_form.html"
-    success_url = reverse_lazy("task-list")
+
+class TaskUpdateView(LoginRequiredMixin, TaskFormMixin, UpdateView):
+    queryset = Task.objects.select_related("assignee")
 
 class TaskDetailView(LoginRequiredMixin, DetailView):
-    model = Task
+    queryset = Task.objects.select_related("project", "assignee")
     template_name = "tracker/task_detail.html"
 
 class TaskDeleteView(LoginRequiredMixin, DeleteView):
@@ -58,7 +113,53 @@ class ProjectListCreateView(LoginRequiredMixin, ListView):
     context_object_name = "projects"
 
     def get_queryset(self):
-        return Project.objects.filter(owner=self.request.user)
+        return caching.project_summaries(self.request.user)
+
+@login_required
+def user_autocomplete(request):
+    """Up to 10 users whose username starts with ?q=, for the assignee box."""
+    q = request.GET.get("q", "")
+    name = User.USERNAME_FIELD
+    users = []
+    if q:
+        # a range on the unique username index: SQLite answers LIKE by scanning
+        users = (User.objects.filter(**{f"{name}__gte": q, f"{name}__lt": q + "\U0010ffff"})
+                 .order_by(name).values_list("id", name)[:10])
+    return JsonResponse({"results": [{"id": pk, "username": username} for pk, username in users]})
+
+def _bulk_response(run):
+    """JSON for a bulk operation: per-row results, 400 if anything was rejected."""
+    try:
+        return JsonResponse({"results": run()})
+    except ValidationError as e:
+        return JsonResponse({"errors": e.message_dict}, status=400)
+    except bulk.BulkError as e:
+        return JsonResponse({"results": e.results}, status=400)
+
+@login_required
+@require_POST
+def task_bulk(request):
+    """{"action": "status"|"priority"|"assign"|"delete", "ids": [...], "value": ...}"""
+    def run():
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            raise ValidationError({"__all__": ["Malformed JSON body."]})
+        if not isinstance(data, dict):
+            raise ValidationError({"__all__": ["Expected a JSON object."]})
+        tasks = user_tasks(request.user, caching.user_projects(request.user))
+        return bulk.change(tasks, data.get("action"), data.get("ids"), data.get("value"))
+    return _bulk_response(run)
+
+@login_required
+@require_POST
+def task_import(request):
+    """Tasks from a CSV or JSON body; rows with an "id" update that task."""
+    def run():
+        rows = bulk.parse(request.body, request.content_type)
+        projects = caching.user_projects(request.user)
+        return bulk.import_tasks(user_tasks(request.user, projects), projects, rows)
+    return _bulk_response(run)
 
 @login_required
 def project_create(request):